@@ -0,0 +1,195 @@
+"""
+Benchmark harness for the bundled plugins.
+
+    python benchmarks/run_benchmarks.py --scale small --output results.json
+    python benchmarks/run_benchmarks.py --data-dir /tmp/bench_plate --baseline baseline.json --repeat 3
+
+Every case calls the plugin's run() headlessly in a fresh subprocess, so import and
+cache state do not leak between cases, and records wall time, throughput (planes/s or
+rows/s), peak RSS (the larger of the run process and its worker processes) and the
+run's RSS increase: the run process's peak over its RSS once the plugin is imported,
+so the import footprint does not mask changes in the plugin's own memory use.
+Outputs of a previous repetition are removed first, and persistent caches are disabled,
+so every repetition does the full work. With --baseline, wall times are compared
+against a previous results file and cases slower by more than --tolerance are reported.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+
+# name -> plugin module, data sub-directory, run() parameters, work unit for throughput,
+# plate.json count used as the amount of work, outputs removed before every run (globs)
+CASES = {
+    "mip_in_memory": ("zstack_filter", "images", {"use_focus_cache": False},
+                      "planes", "planes", ["Filtered_MIPs*"]),
+    "mip_streaming": ("zstack_filter", "images", {"use_focus_cache": False, "streaming_mip": True},
+                      "planes", "planes", ["Filtered_MIPs*"]),
+    "mip_pipelined": ("zstack_filter", "images", {"use_focus_cache": False, "pipelined": True},
+                      "planes", "planes", ["Filtered_MIPs*"]),
+    "merge_csv": ("cp_merger_module", "cp", {}, "rows", "cells", ["Analysis_Results"]),
+    "merge_compact": ("cp_merger_module", "cp", {"compact_dtypes": True}, "rows", "cells", ["Analysis_Results"]),
+    "normalize_pycytominer": ("normalization_plugin", "normalization", {"engine": "pycytominer"},
+                              "rows", "joined_rows", ["*_mad.csv", "*_std.csv"]),
+    "normalize_native": ("normalization_plugin", "normalization", {"engine": "native"},
+                         "rows", "joined_rows", ["*_mad.csv", "*_std.csv"]),
+    "normalize_chunked": ("normalization_plugin", "normalization", {"chunk_size": 50000},
+                          "rows", "joined_rows", ["*_mad.csv", "*_std.csv"]),
+}
+
+def peak_rss_mb(who="self"):
+    """Lifetime peak RSS of this process ('self') or its finished children; 0 without resource."""
+    if resource is None:
+        return 0.0
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    return usage.ru_maxrss / scale
+
+def child(module_name, data_path, params):
+    """Runs inside the benchmark subprocess: one plugin run, measurements printed as JSON."""
+    sys.path.insert(0, str(REPO_ROOT))
+    from plugin_manager import discover_plugins
+    from utils.metrics import current_rss_mb
+
+    plugin = discover_plugins(REPO_ROOT / "modules")[module_name]
+    plugin.load()  # imports are not part of the measurement
+    loaded_rss = current_rss_mb()
+    if loaded_rss is None:
+        loaded_rss = peak_rss_mb()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    result = plugin.run(data_path=data_path, **params)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    own_peak = peak_rss_mb()
+    print(json.dumps({"wall_s": wall, "cpu_s": cpu, "peak_rss_mb": max(own_peak, peak_rss_mb("children")),
+                      "loaded_rss_mb": loaded_rss, "rss_increase_mb": max(own_peak - loaded_rss, 0.0),
+                      "result": "" if result is None else str(result)}))
+
+def run_case(name, data_dir, plate_info, params_override):
+    module_name, sub_dir, params, unit, count_key, outputs = CASES[name]
+    data_path = Path(data_dir) / sub_dir
+    for pattern in outputs:
+        for path in data_path.glob(pattern):
+            shutil.rmtree(path) if path.is_dir() else path.unlink()
+    params = dict(params, **params_override.get(module_name, {}))
+    if module_name == "normalization_plugin":
+        params.setdefault("column_dtypes_path", str(data_path / "column_dtypes.csv"))
+
+    proc = subprocess.run([sys.executable, __file__, "--child", module_name, str(data_path), json.dumps(params)],
+                          capture_output=True, text=True, cwd=REPO_ROOT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{proc.stderr}")
+    measured = json.loads(proc.stdout.strip().splitlines()[-1])
+    if measured["result"].startswith("Error:"):
+        raise RuntimeError(f"{name} failed: {measured['result']}")
+    measured["throughput"] = plate_info[count_key] / measured["wall_s"]
+    measured["unit"] = f"{unit}/s"
+    return measured
+
+def summarize(runs):
+    """Median repetition by wall time, plus every repetition's wall time."""
+    best = sorted(runs, key=lambda r: r["wall_s"])[len(runs) // 2]
+    return {"wall_s": best["wall_s"], "cpu_s": best["cpu_s"], "throughput": best["throughput"],
+            "unit": best["unit"], "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+            "rss_increase_mb": max(r["rss_increase_mb"] for r in runs),
+            "runs_wall_s": [r["wall_s"] for r in runs]}
+
+def compare(results, baseline, tolerance):
+    """Prints wall time ratios against baseline. Returns the names of regressed cases."""
+    regressions = []
+    print(f"\n{'case':<24}{'baseline s':>12}{'now s':>10}{'ratio':>8}")
+    for name, now in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if before is None:
+            print(f"{name:<24}{'-':>12}{now['wall_s']:>10.3f}{'new':>8}")
+            continue
+        ratio = now["wall_s"] / before["wall_s"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  SLOWER"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(f"{name:<24}{before['wall_s']:>12.3f}{now['wall_s']:>10.3f}{ratio:>8.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--child":
+        child(argv[1], argv[2], json.loads(argv[3]))
+        return 0
+
+    sys.path.insert(0, str(BENCH_DIR))
+    from synthetic_plate import SCALES, generate
+
+    parser = argparse.ArgumentParser(description="Benchmark the bundled plugins on a synthetic plate.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--data-dir", help="Existing synthetic plate (see synthetic_plate.py); "
+                                           "generated in a temporary directory if omitted.")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown reported as a regression (default 0.10).")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="hcs_bench_")
+        data_dir = Path(tmp.name)
+        print(f"Generating {args.scale} plate in {data_dir} ...", file=sys.stderr)
+        generate(data_dir, **SCALES[args.scale])
+    with open(data_dir / "plate.json") as f:
+        plate_info = json.load(f)
+
+    workers = {"num_workers": args.num_workers}
+    params_override = {"zstack_filter": workers, "cp_merger_module": workers}
+    results = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                        "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                        "num_workers": args.num_workers, "plate": plate_info},
+               "cases": {}}
+    try:
+        for name in args.cases:
+            runs = [run_case(name, data_dir, plate_info, params_override) for _ in range(args.repeat)]
+            results["cases"][name] = summary = summarize(runs)
+            print(f"{name:<24}{summary['wall_s']:>9.3f} s {summary['throughput']:>12.0f} {summary['unit']:<9}"
+                  f"{summary['peak_rss_mb']:>8.0f} MB peak RSS (+{summary['rss_increase_mb']:.0f} MB in run)",
+                  file=sys.stderr)
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
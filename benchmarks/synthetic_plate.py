@@ -0,0 +1,133 @@
+"""
+Synthetic plate generator for the benchmarks.
+
+    python benchmarks/synthetic_plate.py /tmp/bench_plate --scale small
+    python benchmarks/synthetic_plate.py /tmp/bench_plate --wells 96 --z-planes 30 --image-size 1024
+
+Layout of the output directory:
+    images/<well>/WxxFxxTxxZxxxCxx.tif     Z-stacks for Smart MIP Filter
+    cp/<well>/MyExpt_{Cell,Cytoplasm,Nucleus,Image}.csv   CellProfiler output for HCS Master Aggregator
+    normalization/<plate>_joined.csv, column_dtypes.csv   input for Well-Level Normalization
+    plate.json                             generation parameters and item counts
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import tifffile
+from scipy import ndimage
+
+SCALES = {
+    "small": dict(wells=4, fields=2, z_planes=10, channels=2, image_size=256, cells_per_image=200, features=40),
+    "medium": dict(wells=24, fields=4, z_planes=20, channels=2, image_size=512, cells_per_image=500, features=150),
+    "large": dict(wells=96, fields=9, z_planes=30, channels=2, image_size=1024, cells_per_image=1000, features=400),
+}
+
+COMPARTMENTS = ("Cell", "Cytoplasm", "Nucleus")
+
+def well_name(i):
+    return f"W{i + 1:02d}"
+
+def write_stacks(out_dir, wells, fields, z_planes, channels, image_size, rng):
+    """Blob images blurred by distance from a per-stack focal plane, so focus scores vary along Z."""
+    planes = 0
+    for w in range(wells):
+        well_dir = out_dir / "images" / well_name(w)
+        well_dir.mkdir(parents=True, exist_ok=True)
+        for f in range(fields):
+            sharp = np.zeros((image_size, image_size), dtype=np.float32)
+            n_blobs = max(image_size * image_size // 2000, 1)
+            sharp[rng.integers(0, image_size, n_blobs), rng.integers(0, image_size, n_blobs)] = 1.0
+            sharp = ndimage.gaussian_filter(sharp, 2.0) * 60000.0
+            focus = rng.integers(0, z_planes)
+            for z in range(z_planes):
+                blurred = ndimage.gaussian_filter(sharp, 0.5 + abs(z - focus))
+                for c in range(channels):
+                    noise = rng.normal(200.0, 20.0, blurred.shape).astype(np.float32)
+                    plane = np.clip(blurred * (1.0 - 0.2 * c) + noise, 0, 65535).astype(np.uint16)
+                    tifffile.imwrite(well_dir / f"W{w + 1:02d}F{f + 1:02d}T01Z{z:03d}C{c + 1:02d}.tif", plane)
+                    planes += 1
+    return planes
+
+def feature_names(features):
+    """CellProfiler-like measurement names, split between shape and intensity."""
+    n_shape = features // 2
+    return ([f"AreaShape_Feature{j}" for j in range(n_shape)] +
+            [f"Intensity_MeanIntensity_Ch{j}" for j in range(features - n_shape)])
+
+def write_cp_csvs(out_dir, plate, wells, fields, cells_per_image, features, rng):
+    """Per-well CellProfiler exports; returns the number of single-cell rows."""
+    names = feature_names(features)
+    rows = 0
+    for w in range(wells):
+        well_dir = out_dir / "cp" / well_name(w)
+        well_dir.mkdir(parents=True, exist_ok=True)
+        image_numbers = np.repeat(np.arange(1, fields + 1), cells_per_image)
+        object_numbers = np.tile(np.arange(1, cells_per_image + 1), fields)
+        for compartment in COMPARTMENTS:
+            df = pd.DataFrame({"ImageNumber": image_numbers, "ObjectNumber": object_numbers,
+                               "Metadata_Plate": plate, "Metadata_Well": well_name(w),
+                               "Metadata_Site": image_numbers})
+            values = rng.lognormal(0.0, 0.5, size=(len(df), features))
+            df = pd.concat([df, pd.DataFrame(values, columns=names)], axis=1)
+            df.to_csv(well_dir / f"MyExpt_{compartment}.csv", index=False)
+        pd.DataFrame({"ImageNumber": np.arange(1, fields + 1), "Metadata_Plate": plate,
+                      "Metadata_Well": well_name(w), "Count_Cell": cells_per_image,
+                      "FileName_DNA": [f"{well_name(w)}F{f + 1:02d}.tif" for f in range(fields)]}
+                     ).to_csv(well_dir / "MyExpt_Image.csv", index=False)
+        rows += len(image_numbers)
+    return rows
+
+def write_joined(out_dir, plate, wells, fields, cells_per_image, features, rng):
+    """One aggregated *_joined.csv plus the column_dtypes.csv describing it; returns its row count."""
+    norm_dir = out_dir / "normalization"
+    norm_dir.mkdir(parents=True, exist_ok=True)
+    n = wells * fields * cells_per_image
+    meta = pd.DataFrame({"Metadata_Plate": plate,
+                         "Metadata_Well": np.repeat([well_name(w) for w in range(wells)], fields * cells_per_image),
+                         "Metadata_Site": np.tile(np.repeat(np.arange(1, fields + 1), cells_per_image), wells)})
+    names = [f"{compartment}_{name}" for compartment in COMPARTMENTS
+             for name in feature_names(max(features // len(COMPARTMENTS), 1))]
+    values = pd.DataFrame(rng.lognormal(0.0, 0.5, size=(n, len(names))), columns=names)
+    pd.concat([meta, values], axis=1).to_csv(norm_dir / f"{plate}_joined.csv", index=False)
+    pd.DataFrame({"Column_Name": list(meta.columns) + names,
+                  "Column_Type": ["metadata"] * len(meta.columns) + ["feature"] * len(names)}
+                 ).to_csv(norm_dir / "column_dtypes.csv", index=False)
+    return n
+
+def generate(out_dir, plate="BenchPlate", wells=4, fields=2, z_planes=10, channels=2, image_size=256,
+             cells_per_image=200, features=40, seed=0):
+    """Writes a synthetic plate to out_dir and returns its description (also saved as plate.json)."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    info = dict(plate=plate, wells=wells, fields=fields, z_planes=z_planes, channels=channels,
+                image_size=image_size, cells_per_image=cells_per_image, features=features, seed=seed)
+    info["planes"] = write_stacks(out_dir, wells, fields, z_planes, channels, image_size, rng)
+    info["cells"] = write_cp_csvs(out_dir, plate, wells, fields, cells_per_image, features, rng)
+    info["joined_rows"] = write_joined(out_dir, plate, wells, fields, cells_per_image, features, rng)
+    with open(out_dir / "plate.json", "w") as f:
+        json.dump(info, f, indent=1)
+    return info
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic HCS plate for benchmarking.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small",
+                        help="Preset sizes; the options below override individual values.")
+    parser.add_argument("--plate", default="BenchPlate")
+    for name in SCALES["small"]:
+        parser.add_argument("--" + name.replace("_", "-"), dest=name, type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    params = dict(SCALES[args.scale])
+    params.update({k: getattr(args, k) for k in params if getattr(args, k) is not None})
+    info = generate(args.out_dir, args.plate, seed=args.seed, **params)
+    print(json.dumps(info, indent=1))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
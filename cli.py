@@ -0,0 +1,235 @@
+"""
+Headless entry point: runs analysis plugins without the Qt GUI.
+
+    python cli.py list
+    python cli.py run zstack_filter /data/plate1 --threshold-pct 80 --no-use-focus-cache
+    python cli.py shard cp_merger_module /data/screen --unit-glob "*" --shard-dir /shared/merge
+    python cli.py chain /data/plate1 /data/plate2 --column-dtypes-path /data/column_dtypes.csv
+
+Plugin parameters become flags (--num-workers 8, --incremental / --no-incremental).
+In shard mode every node runs the same command; each work unit (by default every plate
+directory under the root) is claimed through lock files in the shared shard directory,
+so nodes pull units until none are left.
+Chain mode runs Smart MIP Filter -> HCS Master Aggregator -> Well-Level Normalization on
+every plate as one pipeline (utils.pipeline.plate_chain): plates run concurrently within
+the CPU budget, the aggregated table reaches normalization through the columnar cache,
+and rerunning after a failure or Ctrl-C resumes after the completed steps.
+"""
+import sys
+import signal
+import random
+import socket
+import argparse
+import traceback
+from pathlib import Path
+
+from plugin_manager import discover_plugins, plugin_parameters, RESERVED_KEYWORDS
+from utils.metrics import StageMetrics
+from utils.pipeline import Pipeline, plate_chain
+from utils.progress import AnalysisCancelled, CancellationToken, ThrottledProgress
+from utils.sharding import WorkShards
+
+ARG_TYPES = {int: int, float: float, str: str}
+
+class ConsoleProgress:
+    """progress_callback replacement that prints percentages to stderr."""
+    def __init__(self, label):
+        self.label = label
+        self.tty = sys.stderr.isatty()
+
+    def emit(self, value):
+        end = "" if self.tty and value < 100 else "\n"
+        print(f"\r{self.label}: {value:3d}%", end=end, file=sys.stderr, flush=True)
+
+def find_plugin(plugins, name):
+    """Looks a plugin up by module name or display NAME."""
+    if name in plugins:
+        return plugins[name]
+    for plugin in plugins.values():
+        if getattr(plugin, "NAME", None) == name:
+            return plugin
+    raise SystemExit(f"Unknown plugin '{name}'. Run 'cli.py list' for the available plugins.")
+
+def add_plugin_arguments(group, plugin):
+    """Maps the plugin's run() parameters to flags."""
+    for name, arg_type, default in plugin_parameters(plugin):
+        if name in RESERVED_KEYWORDS:
+            continue
+        flag = "--" + name.replace("_", "-")
+        if arg_type is bool:
+            group.add_argument(flag, dest=name, action=argparse.BooleanOptionalAction, default=bool(default))
+        elif default is None:
+            group.add_argument(flag, dest=name, type=ARG_TYPES.get(arg_type, str), required=True)
+        else:
+            group.add_argument(flag, dest=name, type=ARG_TYPES.get(arg_type, str), default=default,
+                               help=f"default: {default!r}")
+
+def build_parser(plugin=None):
+    parser = argparse.ArgumentParser(description="Run HCS analysis plugins without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the available plugins and their parameters.")
+
+    run_parser = commands.add_parser("run", help="Run a plugin on one data directory.")
+    run_parser.add_argument("plugin", help="Module name (e.g. zstack_filter) or display name.")
+    run_parser.add_argument("data_path")
+
+    shard_parser = commands.add_parser("shard", help="Pull work units from a shared directory until none are left.")
+    shard_parser.add_argument("plugin", help="Module name (e.g. zstack_filter) or display name.")
+    shard_parser.add_argument("root", help="Directory whose sub-directories are the work units.")
+    shard_parser.add_argument("--unit-glob", default="*",
+                              help="Glob (relative to root) selecting work unit directories, e.g. '*' "
+                                   "for plates or '*/*' for wells. Each unit is passed as data_path.")
+    shard_parser.add_argument("--shard-dir", help="Shared lock directory (default: <root>/.shards/<plugin>).")
+    shard_parser.add_argument("--stale-after", type=float, default=600.0,
+                              help="Seconds without a heartbeat after which a lock is taken over.")
+    shard_parser.add_argument("--retry-failed", action="store_true", help="Also claim units that failed before.")
+
+    chain_parser = commands.add_parser("chain", help="Run MIP -> aggregation -> normalization on plates.")
+    chain_parser.add_argument("plates", nargs="+", help="Plate directories.")
+    chain_parser.add_argument("--column-dtypes-path", default="CSVs/column_dtypes.csv")
+    chain_parser.add_argument("--output-directory", default="Analysis_Results",
+                              help="Aggregation results folder inside each plate (default: %(default)s).")
+    chain_parser.add_argument("--num-workers", type=int, default=4, help="Workers per MIP/aggregation step.")
+    chain_parser.add_argument("--cpu-budget", type=int, help="CPUs shared by concurrent steps (default: all).")
+    chain_parser.add_argument("--reset", action="store_true",
+                              help="Forget the steps an interrupted earlier run completed and start over.")
+
+    if plugin is not None:
+        for sub in (run_parser, shard_parser):
+            add_plugin_arguments(sub.add_argument_group(f"{plugin.NAME} parameters"), plugin)
+    return parser
+
+def run_plugin(plugin, data_path, params, cancel_token, label):
+    """Calls plugin.run, injecting the reserved keywords it accepts."""
+    accepted = {name for name, _, _ in plugin_parameters(plugin)}
+    kwargs = dict(params)
+    if "progress_callback" in accepted:
+        kwargs["progress_callback"] = ThrottledProgress(ConsoleProgress(label), min_interval=0.5)
+    if "cancel_token" in accepted:
+        kwargs["cancel_token"] = cancel_token
+    if "metrics" in accepted:
+        kwargs["metrics"] = StageMetrics()
+    status = "error"
+    try:
+        result = plugin.run(data_path=str(data_path), **kwargs)
+        status = "finished"
+    except AnalysisCancelled:
+        status = "cancelled"
+        raise
+    finally:
+        if "progress_callback" in kwargs:
+            kwargs["progress_callback"].flush()
+        if "metrics" in kwargs:
+            path = kwargs["metrics"].write_jsonl(plugin.NAME, status=status, data_path=str(data_path))
+            print(kwargs["metrics"].summary_table(), f"\nStage metrics written to {path}", file=sys.stderr)
+    return "" if result is None else str(result)
+
+def plugin_params(plugin, args):
+    names = [name for name, _, _ in plugin_parameters(plugin) if name not in RESERVED_KEYWORDS]
+    return {name: getattr(args, name) for name in names}
+
+def list_plugins(plugins):
+    for module_name, plugin in plugins.items():
+        print(f"{module_name}: {plugin.NAME}")
+        if getattr(plugin, "DESCRIPTION", ""):
+            print(f"    {plugin.DESCRIPTION}")
+        for name, arg_type, default in plugin_parameters(plugin):
+            if name not in RESERVED_KEYWORDS:
+                type_name = getattr(arg_type, "__name__", "str")
+                print(f"    --{name.replace('_', '-')} ({type_name}, default {default!r})")
+
+def run_shards(plugin, args, params, cancel_token):
+    """Claims and processes units until every unit is done, failed or held by a live node."""
+    root = Path(args.root)
+    shard_dir = Path(args.shard_dir) if args.shard_dir else root / ".shards" / Path(plugin.__file__).stem
+    units = sorted(p.relative_to(root) for p in root.glob(args.unit_glob)
+                   if p.is_dir() and not p.name.startswith("."))
+    shards = WorkShards(shard_dir, stale_after=args.stale_after)
+    # Nodes walk the units in different orders so they rarely race for the same lock
+    random.Random(shards.node_id).shuffle(units)
+
+    done = failed = 0
+    cancelled = False
+    for unit in units:
+        if cancel_token.cancelled:
+            cancelled = True
+            break
+        if not shards.claim(unit, retry_failed=args.retry_failed):
+            continue
+        print(f"[{shards.node_id}] {unit}", file=sys.stderr)
+        try:
+            with shards.heartbeat(unit):
+                message = run_plugin(plugin, root / unit, params, cancel_token, str(unit))
+        except AnalysisCancelled:
+            shards.release(unit)
+            cancelled = True
+            break
+        except Exception:
+            traceback.print_exc()
+            shards.fail(unit, traceback.format_exc())
+            failed += 1
+            continue
+        if message.startswith("Error:"):
+            shards.fail(unit, message)
+            failed += 1
+        else:
+            shards.complete(unit, message)
+            done += 1
+
+    pending = [unit for unit in units if shards.status(unit) is None]
+    print(f"{socket.gethostname()}: {done} units done, {failed} failed here; "
+          f"{sum(shards.status(u) == 'done' for u in units)}/{len(units)} done overall, "
+          f"{len(pending)} unclaimed", file=sys.stderr)
+    if cancelled:
+        print("Cancelled.", file=sys.stderr)
+        return 130
+    return 1 if failed else 0
+
+def run_chain(plugins, args, cancel_token):
+    """Runs the standard per-plate chain on every plate as one pipeline."""
+    pipeline = Pipeline(cpu_budget=args.cpu_budget)
+    for plate in args.plates:
+        plate_chain(pipeline, Path(plate).resolve(), plugins, args.column_dtypes_path,
+                    args.output_directory, args.num_workers)
+    if args.reset:
+        pipeline.reset()
+    pipeline.status_callback = lambda step_id, status, message: print(f"{step_id}: {status}", file=sys.stderr)
+    summary = pipeline.run(ThrottledProgress(ConsoleProgress("pipeline"), min_interval=0.5), cancel_token)
+    print(summary)
+    return 1 if any(status in ("failed", "skipped") for status in pipeline.status.values()) else 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    plugins = discover_plugins(Path(__file__).parent / "modules")
+    # The plugin's own flags can only be added once we know which plugin was asked for
+    plugin = (find_plugin(plugins, argv[1])
+              if len(argv) > 1 and argv[0] in ("run", "shard") and not argv[1].startswith("-") else None)
+    args = build_parser(plugin).parse_args(argv)
+
+    if args.command == "list":
+        list_plugins(plugins)
+        return 0
+
+    # First Ctrl-C cancels cooperatively, a second one interrupts
+    cancel_token = CancellationToken()
+    def on_interrupt(signum, frame):
+        print("\nCancelling... (press Ctrl-C again to abort)", file=sys.stderr)
+        cancel_token.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGINT, on_interrupt)
+
+    try:
+        if args.command == "chain":
+            return run_chain(plugins, args, cancel_token)
+        params = plugin_params(plugin, args)
+        if args.command == "shard":
+            return run_shards(plugin, args, params, cancel_token)
+        message = run_plugin(plugin, args.data_path, params, cancel_token, plugin.NAME)
+    except AnalysisCancelled:
+        print("Cancelled.", file=sys.stderr)
+        return 130
+    print(message)
+    return 1 if message.startswith("Error:") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
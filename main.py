@@ -1,13 +1,16 @@
 import sys
+from pathlib import Path
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QListWidget, QPushButton, QProgressBar, QLabel, QFileDialog, 
-    QMessageBox, QScrollArea
+    QMessageBox, QScrollArea, QSpinBox, QDoubleSpinBox, QCheckBox,
+    QDialog, QTableWidget, QTableWidgetItem
 )
 from PyQt6.QtCore import QThreadPool, pyqtSlot
 
 # Correct Imports: UI/Logic separation [cite: 2]
-from plugin_manager import discover_plugins, create_plugin_ui
+from plugin_manager import discover_plugins, create_plugin_ui, plugin_parameters
+from utils.pipeline import Pipeline
 from utils.worker import AnalysisWorker
 
 class HCSApp(QMainWindow):
@@ -20,6 +23,8 @@ class HCSApp(QMainWindow):
         self.threadpool = QThreadPool() 
         self.selected_plugin = None
         self.data_path = None
+        self.worker = None
+        self.queue = []
         
         self.init_ui()
         self.load_plugins()
@@ -44,6 +49,25 @@ class HCSApp(QMainWindow):
         self.lbl_path.setWordWrap(True)
         sidebar.addWidget(self.lbl_path)
         
+        # Pipeline Queue: steps run as a dependency graph
+        sidebar.addWidget(QLabel("Pipeline Queue"))
+        self.queue_list = QListWidget()
+        sidebar.addWidget(self.queue_list)
+
+        self.btn_queue = QPushButton("Add to Queue")
+        self.btn_queue.setEnabled(False)
+        self.btn_queue.clicked.connect(self.add_to_queue)
+        sidebar.addWidget(self.btn_queue)
+
+        self.btn_run_queue = QPushButton("Run Queue")
+        self.btn_run_queue.setEnabled(False)
+        self.btn_run_queue.clicked.connect(self.run_queue)
+        sidebar.addWidget(self.btn_run_queue)
+
+        self.btn_clear_queue = QPushButton("Clear Queue")
+        self.btn_clear_queue.clicked.connect(self.clear_queue)
+        sidebar.addWidget(self.btn_clear_queue)
+        
         main_layout.addLayout(sidebar, 1)
 
         # Main Panel: Dynamic UI Generation [cite: 37]
@@ -64,6 +88,11 @@ class HCSApp(QMainWindow):
         self.btn_run.setEnabled(False)
         self.btn_run.clicked.connect(self.run_analysis)
         footer.addWidget(self.btn_run)
+
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancel_analysis)
+        footer.addWidget(self.btn_cancel)
         
         display_panel.addLayout(footer)
         main_layout.addLayout(display_panel, 3)
@@ -104,11 +133,13 @@ class HCSApp(QMainWindow):
         self.check_run_ready()
 
     def check_run_ready(self):
-        if self.selected_plugin and self.data_path:
-            self.btn_run.setEnabled(True)
+        ready = bool(self.selected_plugin and self.data_path and self.worker is None)
+        self.btn_run.setEnabled(ready)
+        self.btn_queue.setEnabled(ready)
+        self.btn_run_queue.setEnabled(bool(self.queue) and self.worker is None)
 
-    def run_analysis(self):
-        """Collection & Execution workflow [cite: 38-39]."""
+    def collect_params(self):
+        """Reads the current parameter form."""
         params = {}
         for name, widget in self.widgets.items():
             if isinstance(widget, QSpinBox) or isinstance(widget, QDoubleSpinBox):
@@ -117,34 +148,127 @@ class HCSApp(QMainWindow):
                 params[name] = widget.isChecked()
             else:
                 params[name] = widget.text()
+        return params
 
+    def run_analysis(self):
+        """Collection & Execution workflow [cite: 38-39]."""
+        params = self.collect_params()
         params['data_path'] = self.data_path
-        params['progress_callback'] = True 
-        
+        # Reserved keywords are injected by the worker, only for plugins that accept them
+        accepted = {name for name, _, _ in plugin_parameters(self.selected_plugin)}
+        for name in ('progress_callback', 'cancel_token', 'metrics'):
+            if name in accepted:
+                params[name] = True
+        self.start_worker(self.selected_plugin.run, params, 'cancel_token' in accepted)
+
+    def add_to_queue(self):
+        """Queues the selected plugin with the current form values on the selected directory."""
+        self.queue.append((self.selected_plugin, self.data_path, self.collect_params()))
+        self.queue_list.addItem(f"{len(self.queue)}. {self.selected_plugin.NAME} - {self.data_path}")
+        self.check_run_ready()
+
+    def clear_queue(self):
+        """Empties the queue and forgets the steps an interrupted run of it had completed."""
+        self.build_pipeline().reset()
+        self.queue = []
+        self.queue_list.clear()
+        self.check_run_ready()
+
+    def build_pipeline(self):
+        """
+        Builds the queue as a pipeline. A step depends on the latest earlier step queued on
+        the same directory or on one of its parents, so each plate's steps run in order
+        while different plates run concurrently.
+        """
+        pipeline = Pipeline()
+        last_step = {}
+        for i, (plugin, data_path, params) in enumerate(self.queue, 1):
+            path = Path(data_path)
+            parents = [str(p) for p in (path, *path.parents)]
+            # The latest (highest-numbered) earlier step, not the one on the nearest directory
+            earlier = [last_step[p] for p in parents if p in last_step]
+            depends_on = [max(earlier)[1]] if earlier else []
+            step = pipeline.add_step(f"{i}. {plugin.NAME} ({path.name})", plugin, data_path, params, depends_on)
+            last_step[str(path)] = (i, step.step_id)
+        return pipeline
+
+    def run_queue(self):
+        """Runs the queue; after a failure or cancellation, rerunning it resumes after the completed steps."""
+        self.start_worker(self.build_pipeline().run, {'progress_callback': True, 'cancel_token': True}, True)
+
+    def start_worker(self, fn, params, cancellable):
         self.btn_run.setEnabled(False)
+        self.btn_queue.setEnabled(False)
+        self.btn_run_queue.setEnabled(False)
+        self.btn_cancel.setEnabled(cancellable)
         self.progress_bar.setValue(0)
         
         # Bridge: Execute in separate context [cite: 9, 39]
-        worker = AnalysisWorker(self.selected_plugin.run, **params)
-        worker.signals.progress.connect(self.progress_bar.setValue)
-        worker.signals.finished.connect(self.on_finished)
-        worker.signals.error.connect(self.on_error)
+        self.worker = AnalysisWorker(fn, **params)
+        self.worker.signals.progress.connect(self.progress_bar.setValue)
+        self.worker.signals.result.connect(self.on_finished)
+        self.worker.signals.error.connect(self.on_error)
+        self.worker.signals.cancelled.connect(self.on_cancelled)
+        self.worker.signals.finished.connect(self.on_worker_done)
         
-        self.threadpool.start(worker)
+        self.threadpool.start(self.worker)
+
+    def cancel_analysis(self):
+        """Cooperative cancellation: the plugin stops at its next check."""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.btn_cancel.setEnabled(False)
 
     @pyqtSlot(object)
     def on_finished(self, message):
         """Successful execution callback[cite: 40]."""
-        self.btn_run.setEnabled(True)
         self.progress_bar.setValue(100)
+        # The message box runs a nested event loop that delivers the queued finished
+        # signal, which clears self.worker, so take the metrics first
+        metrics = self.worker.metrics if self.worker is not None else None
         QMessageBox.information(self, "Analysis Complete", str(message))
+        if metrics is not None:
+            self.show_metrics(metrics.records())
 
-    @pyqtSlot(str)
-    def on_error(self, error_msg):
+    def show_metrics(self, records):
+        """Per-stage summary table of the finished run."""
+        columns = [("Stage", "stage"), ("Calls", "calls"), ("Wall s", "wall_s"), ("CPU s", "cpu_s"),
+                   ("Read MB", "bytes_read"), ("Written MB", "bytes_written"), ("Peak RSS MB", "peak_rss_mb")]
+        table = QTableWidget(len(records), len(columns))
+        table.setHorizontalHeaderLabels([title for title, _ in columns])
+        for row, record in enumerate(records):
+            for col, (_, key) in enumerate(columns):
+                value = record[key]
+                if key.startswith("bytes"):
+                    value = f"{value / 1e6:.1f}"
+                elif isinstance(value, float):
+                    value = f"{value:.2f}"
+                table.setItem(row, col, QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+
+        self.metrics_dialog = QDialog(self)
+        self.metrics_dialog.setWindowTitle("Run Metrics")
+        QVBoxLayout(self.metrics_dialog).addWidget(table)
+        self.metrics_dialog.resize(720, 320)
+        self.metrics_dialog.show()
+
+    @pyqtSlot(tuple)
+    def on_error(self, error):
         """Error resilience[cite: 50]."""
-        self.btn_run.setEnabled(True)
+        exctype, value, tb = error
+        self.progress_bar.setValue(0)
+        QMessageBox.critical(self, "Analysis Error", f"A plugin error occurred:\n\n{value}\n\n{tb}")
+
+    @pyqtSlot()
+    def on_cancelled(self):
         self.progress_bar.setValue(0)
-        QMessageBox.critical(self, "Analysis Error", f"A plugin error occurred:\n\n{error_msg}")
+        QMessageBox.information(self, "Analysis Cancelled", "The analysis was cancelled.")
+
+    @pyqtSlot()
+    def on_worker_done(self):
+        self.worker = None
+        self.btn_cancel.setEnabled(False)
+        self.check_run_ready()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
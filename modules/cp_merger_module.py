@@ -1,13 +1,76 @@
+import json
+import shutil
+import fnmatch
+import hashlib
+import concurrent.futures
+from collections import deque
+from contextlib import closing
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
+from utils.columnar_cache import default_cache
+from utils.metrics import StageMetrics
+from utils.progress import cancel_pending_on_error, raise_if_cancelled
+from utils.qc_index import QUANTILE_LEVELS, build_qc_index, load_summary, save_summary, summarize_well
+
 NAME = "HCS Master Aggregator"
 DESCRIPTION = "Merges Cell, Cyto, and Nucleus CSVs across all wells recursively."
 
 MERGE_KEYS = ["ImageNumber", "ObjectNumber"]
+CSV_ENGINES = ("c", "pyarrow")
+OUTPUT_FORMATS = ("csv", "parquet")
+MANIFEST_NAME = "aggregation_manifest.json"
+WELL_CACHE_DIR = ".well_cache"
+WELL_CACHE_SUFFIXES = (".cells.parquet", ".image.parquet", ".qc.npz")
+QC_SKETCH_ERROR = 0.01
+
+def read_csv(file_path: Path, engine: str = "c", usecols=None, cache=None, **kwargs) -> pd.DataFrame:
+    """
+    pd.read_csv with the selected parser; options the pyarrow engine rejects are dropped.
+    With a utils.columnar_cache.ColumnarCache, repeated reads come from its columnar sidecars.
+    """
+    if engine == "pyarrow":
+        kwargs.pop("low_memory", None)
+    if cache is not None:
+        return cache.read_csv(file_path, usecols=usecols, engine=engine, **kwargs)
+    return pd.read_csv(file_path, engine=engine, usecols=usecols, **kwargs)
+
+def select_columns(file_path: Path, feature_patterns) -> list:
+    """Header-only read: metadata and merge keys plus the features matching any pattern."""
+    header = pd.read_csv(file_path, nrows=0).columns
+    return [c for c in header
+            if c.startswith("Metadata_") or c in MERGE_KEYS
+            or any(fnmatch.fnmatchcase(c, p) for p in feature_patterns)]
 
-def load_and_prefix(file_path: Path, prefix: str, is_metadata_source: bool = False) -> pd.DataFrame:
-    df = pd.read_csv(file_path, low_memory=False)
+def compact_dtype_plan(columns) -> dict:
+    """Compact loading: categorical metadata, int64 merge keys, float32 features."""
+    return {c: "category" if c.startswith("Metadata_") else "int64" if c in MERGE_KEYS else "float32"
+            for c in columns}
+
+def downcast_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Fallback for tables the dtype plan cannot parse (e.g. text features): downcast after reading."""
+    for c in df.columns:
+        if c.startswith("Metadata_"):
+            df[c] = df[c].astype("category")
+        elif df[c].dtype == np.float64:
+            df[c] = df[c].astype(np.float32)
+    return df
+
+def load_and_prefix(file_path: Path, prefix: str, is_metadata_source: bool = False,
+                    engine: str = "c", feature_patterns=None, compact: bool = False, cache=None) -> pd.DataFrame:
+    usecols = select_columns(file_path, feature_patterns) if feature_patterns else None
+    if compact:
+        # Metadata of the non-source tables is dropped below, so it is never parsed
+        usecols = usecols or list(pd.read_csv(file_path, nrows=0).columns)
+        if not is_metadata_source:
+            usecols = [c for c in usecols if not c.startswith("Metadata_")]
+        try:
+            df = read_csv(file_path, engine, usecols, cache, low_memory=False, dtype=compact_dtype_plan(usecols))
+        except (ValueError, TypeError):
+            df = downcast_frame(read_csv(file_path, engine, usecols, cache, low_memory=False))
+    else:
+        df = read_csv(file_path, engine, usecols, cache, low_memory=False)
     metadata_cols = [c for c in df.columns if c.startswith("Metadata_") or c in MERGE_KEYS]
     if not is_metadata_source:
         drop_meta = [c for c in metadata_cols if c not in MERGE_KEYS]
@@ -16,6 +79,159 @@ def load_and_prefix(file_path: Path, prefix: str, is_metadata_source: bool = Fal
     df = df.rename(columns={c: f"{prefix}_{c}" for c in feature_cols})
     return df
 
+def object_keys(df: pd.DataFrame) -> np.ndarray:
+    """Packs (ImageNumber, ObjectNumber) into one sortable int64 key."""
+    image, obj = (df[k].to_numpy(dtype=np.int64) for k in MERGE_KEYS)
+    return (image << 32) | obj
+
+def join_compartments(frames) -> pd.DataFrame:
+    """
+    Inner-joins the compartment tables on MERGE_KEYS without hash-merge copies. Each table
+    is put in (ImageNumber, ObjectNumber) order (a no-op for CellProfiler output); if the
+    keys then align row for row the tables are concatenated column-wise, otherwise they are
+    joined on the sorted, unique integer key (sort-merge).
+    """
+    keyed = []
+    for df in frames:
+        keys = object_keys(df)
+        if len(keys) > 1 and not (np.diff(keys) > 0).all():
+            order = np.argsort(keys, kind="stable")
+            df, keys = df.take(order).reset_index(drop=True), keys[order]
+        keyed.append((df, keys))
+
+    base, base_keys = keyed[0]
+    if all(np.array_equal(keys, base_keys) for _, keys in keyed[1:]):
+        return pd.concat([base] + [df.drop(columns=MERGE_KEYS) for df, _ in keyed[1:]], axis=1)
+
+    if not all(pd.Index(keys).is_unique for _, keys in keyed):
+        # Duplicate object keys: fall back to the hash merge
+        merged = base
+        for df, _ in keyed[1:]:
+            merged = merged.merge(df, on=MERGE_KEYS)
+        return merged
+    merged = base.set_axis(pd.Index(base_keys), axis=0)
+    for df, keys in keyed[1:]:
+        merged = merged.join(df.drop(columns=MERGE_KEYS).set_axis(pd.Index(keys), axis=0), how="inner")
+    return merged.reset_index(drop=True)
+
+def load_well(folder: Path, cell_csv_name: str, cyto_csv_name: str, nuc_csv_name: str,
+              image_csv_name: str, engine: str = "c", feature_patterns=None, compact: bool = False, cache=None,
+              metrics=None):
+    """Loads one well folder. Returns (merged single-cell frame or None, image frame or None)."""
+    metrics = metrics if metrics is not None else StageMetrics()
+    well_id = folder.name
+    idf, m = None, None
+
+    # Image data aggregation
+    img_f = folder / image_csv_name
+    if img_f.exists():
+        with metrics.stage("parse CSVs") as stage:
+            idf = read_csv(img_f, engine, cache=cache)
+            stage.read(img_f.stat().st_size)
+        idf["Metadata_WellID"] = well_id # Safe assignment prevents ValueError
+        if compact:
+            idf = downcast_frame(idf)
+
+    # Single-cell 3-way merge
+    c, cy, n = folder/cell_csv_name, folder/cyto_csv_name, folder/nuc_csv_name
+    if all(p.exists() for p in [c, cy, n]):
+        with metrics.stage("parse CSVs") as stage:
+            frames = [load_and_prefix(path, prefix, prefix == "Cell", engine, feature_patterns, compact, cache)
+                      for path, prefix in [(c, "Cell"), (cy, "Cytoplasm"), (n, "Nucleus")]]
+            stage.read(sum(p.stat().st_size for p in [c, cy, n]))
+        with metrics.stage("join compartments"):
+            if compact:
+                m = join_compartments(frames)
+                m["Metadata_WellID"] = pd.Categorical.from_codes(np.zeros(len(m), dtype=np.int8), [well_id])
+            else:
+                m = frames[0].merge(frames[1], on=MERGE_KEYS).merge(frames[2], on=MERGE_KEYS)
+                m["Metadata_WellID"] = well_id
+        del frames
+    return m, idf
+
+def iter_wells(load, well_folders, num_workers: int):
+    """Yields load(folder) in plate order, keeping at most 2 * num_workers wells in flight."""
+    num_workers = max(num_workers, 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor, \
+            cancel_pending_on_error(executor):
+        pending = deque()
+        for folder in well_folders:
+            pending.append(executor.submit(load, folder))
+            if len(pending) >= 2 * num_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def write_well_partition(df: pd.DataFrame, dataset_dir: Path, schema=None):
+    """
+    Writes one well into a Parquet dataset partitioned by Metadata_WellID, replacing any earlier copy.
+
+    Every well is cast to one dataset schema so the partitions can be read back together.
+    Pass None for the first well: its schema is used, with integer features promoted to
+    float64 (a feature that is integral in one well may hold NaNs in another). Later wells
+    get null columns for features they lack, and features new to the plate are appended.
+    Returns the schema to pass for the next well.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = list(schema) if schema is not None else []
+    known = {field.name for field in fields}
+    for field in table.schema:
+        if field.name in known:
+            continue
+        if pa.types.is_integer(field.type) and field.name not in MERGE_KEYS and not field.name.startswith("Metadata_"):
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    schema = pa.schema(fields)
+    table = pa.Table.from_arrays(
+        [table.column(field.name).cast(field.type) if field.name in table.column_names
+         else pa.nulls(len(table), field.type) for field in schema], schema=schema)
+    pq.write_to_dataset(table, root_path=dataset_dir,
+                        partition_cols=["Metadata_WellID"], existing_data_behavior="delete_matching")
+    return schema
+
+def file_digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def input_state(folder: Path, csv_names, previous=None) -> dict:
+    """
+    Size, mtime and content hash of each input CSV present in a well folder.
+    Hashes are only recomputed for files whose size or mtime differ from previous.
+    """
+    state = {}
+    for name in csv_names:
+        try:
+            st = (folder / name).stat()
+        except FileNotFoundError:
+            continue
+        prev = (previous or {}).get(name)
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            digest = prev["hash"]
+        else:
+            digest = file_digest(folder / name)
+        state[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+    return state
+
+def load_manifest(out_dir: Path, options: dict) -> dict:
+    """Previous run's per-well entries, or {} when missing or produced with other load options."""
+    try:
+        with open(out_dir / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("wells", {}) if manifest.get("options") == options else {}
+
+def save_manifest(out_dir: Path, options: dict, wells: dict):
+    tmp = out_dir / (MANIFEST_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"options": options, "wells": wells}, f, indent=1)
+    tmp.replace(out_dir / MANIFEST_NAME)
+
 def run(
     data_path: str,
     output_directory: str = "Analysis_Results",
@@ -25,8 +241,67 @@ def run(
     image_csv_name: str = "MyExpt_Image.csv",
     final_single_cell_name: str = "master_single_cell.csv",
     final_image_level_name: str = "master_image_level.csv",
+    num_workers: int = 4,
+    csv_engine: str = "c",
+    feature_columns: str = "",
+    output_format: str = "csv",
+    incremental: bool = False,
+    compact_dtypes: bool = False,
+    use_columnar_cache: bool = False,
+    qc_index: bool = True,
+    qc_quantiles: str = "none",
+    metrics=None,
+    cancel_token=None,
     progress_callback=None
 ):
+    """
+    Args:
+        data_path: Plate folder containing one sub-folder of CellProfiler CSVs per well.
+        output_directory: Results folder, relative to data_path unless absolute.
+        cell_csv_name, cyto_csv_name, nuc_csv_name, image_csv_name: Per-well CSV file names.
+        final_single_cell_name, final_image_level_name: Names of the master output tables.
+        num_workers: Wells loaded and merged concurrently.
+        csv_engine: 'c' (pandas default) or 'pyarrow' (multi-threaded parser, requires pyarrow).
+            pyarrow rounds floats exactly, so values can differ from the 'c' parser in the last digit.
+        feature_columns: Optional comma-separated feature names or glob patterns (e.g.
+            'AreaShape_*, Intensity_MeanIntensity_*') to read from the compartment CSVs.
+            Metadata columns and merge keys are always kept; empty reads every column.
+        output_format: 'csv' writes the master tables as today. 'parquet' streams each well's merged
+            cells to disk as soon as it is ready, into a dataset folder named after
+            final_single_cell_name and partitioned by Metadata_WellID, so memory stays at about
+            one well; the image-level table is written as a single .parquet file.
+        incremental: Keep a manifest of each well's input CSV sizes, mtimes and hashes plus a cached
+            merged partition per well (requires pyarrow). Reruns only re-merge wells whose inputs
+            changed and re-assemble the master outputs from the cached partitions.
+        compact_dtypes: Load features as float32 and metadata/well IDs as categoricals, and join the
+            three compartments on sorted (ImageNumber, ObjectNumber) keys instead of hash merges.
+            Roughly halves memory per well; exported values carry float32 precision and rows
+            come out in (ImageNumber, ObjectNumber) order.
+        use_columnar_cache: Read CSVs through the shared columnar cache (utils.columnar_cache), so
+            CSVs parsed by an earlier run are loaded from memory-mapped Feather sidecars. The CSV
+            outputs are registered in the cache as well (unless compact_dtypes is set).
+        qc_index: Summarize every well while merging (cells per image, per-feature count, sum,
+            sum of squares, min and max) into <final_single_cell_name stem>_qc.npz, so plate and
+            well overviews can be read with utils.qc_index.QCIndex without reloading the cells.
+        qc_quantiles: 'none', 'well' or 'image': also keep quantile sketches (about 1% rank error)
+            at that level for approximate medians and percentiles. 'image' costs the most space.
+        metrics: utils.metrics.StageMetrics recording CSV parsing, compartment joins, the
+            incremental well cache, the QC index and output writing (injected by the app).
+        cancel_token: Checked after every well; on cancellation wells not yet started are dropped.
+        progress_callback: PyQt signal for UI progress bar updates.
+    """
+    metrics = metrics if metrics is not None else StageMetrics()
+    csv_engine = csv_engine.strip().lower()
+    if csv_engine not in CSV_ENGINES:
+        return f"Error: Invalid CSV engine '{csv_engine}'. Use one of: {', '.join(CSV_ENGINES)}."
+    feature_patterns = [p.strip() for p in feature_columns.split(",") if p.strip()]
+    output_format = output_format.strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        return f"Error: Invalid output format '{output_format}'. Use one of: {', '.join(OUTPUT_FORMATS)}."
+    qc_quantiles = qc_quantiles.strip().lower()
+    if qc_quantiles not in QUANTILE_LEVELS:
+        return f"Error: Invalid QC quantile level '{qc_quantiles}'. Use one of: {', '.join(QUANTILE_LEVELS)}."
+
     root = Path(data_path).resolve()
     out_dir = Path(output_directory)
     if not out_dir.is_absolute():
@@ -34,31 +309,144 @@ def run(
     out_dir.mkdir(parents=True, exist_ok=True)
     
     well_folders = [f for f in root.iterdir() if f.is_dir() and f != out_dir]
-    sc_list, img_list = [], []
-    
-    for i, folder in enumerate(well_folders):
-        well_id = folder.name
-        
-        # Image data aggregation
-        img_f = folder / image_csv_name
-        if img_f.exists():
-            idf = pd.read_csv(img_f)
-            idf["Metadata_WellID"] = well_id # Safe assignment prevents ValueError
-            img_list.append(idf)
-            
-        # Single-cell 3-way merge
-        c, cy, n = folder/cell_csv_name, folder/cyto_csv_name, folder/nuc_csv_name
-        if all(p.exists() for p in [c, cy, n]):
-            m = load_and_prefix(c, "Cell", True).merge(
-                load_and_prefix(cy, "Cytoplasm"), on=MERGE_KEYS).merge(
-                load_and_prefix(n, "Nucleus"), on=MERGE_KEYS)
-            m["Metadata_WellID"] = well_id
-            sc_list.append(m)
-
-        if progress_callback:
-            progress_callback.emit(int(((i + 1) / len(well_folders)) * 100))
-
-    if sc_list: pd.concat(sc_list, ignore_index=True).to_csv(out_dir/final_single_cell_name, index=False)
-    if img_list: pd.concat(img_list, ignore_index=True).to_csv(out_dir/final_image_level_name, index=False)
+    sc_list, img_list, qc_list = [], [], []
+    sc_schema = None
+
+    # --- Incremental Manifest ---
+    csv_names = [cell_csv_name, cyto_csv_name, nuc_csv_name, image_csv_name]
+    options = {"csv_names": csv_names, "csv_engine": csv_engine, "feature_columns": feature_patterns,
+               "compact_dtypes": compact_dtypes}
+    well_cache = out_dir / WELL_CACHE_DIR
+    previous = load_manifest(out_dir, options) if incremental else {}
+
+    # Without a valid manifest nothing in an existing dataset can be trusted (e.g. written
+    # with other load options, or holding wells since removed from the plate)
+    sc_dataset = out_dir / Path(final_single_cell_name).stem
+    if output_format == "parquet" and sc_dataset.exists() and not previous:
+        shutil.rmtree(sc_dataset)
+    manifest, reused = {}, 0
+    if incremental:
+        well_cache.mkdir(exist_ok=True)
+    cache = default_cache() if use_columnar_cache else None
+    # The cache is shared by the whole process; report only this run's share of its counters
+    cache_counters = cache.counters() if cache is not None else None
+
+    def summarize(well_id, m):
+        if not qc_index or m is None:
+            return None
+        with metrics.stage("QC index"):
+            return summarize_well(m, well_id, qc_quantiles, QC_SKETCH_ERROR)
+
+    def load(folder):
+        if not incremental:
+            m, idf = load_well(folder, cell_csv_name, cyto_csv_name, nuc_csv_name, image_csv_name, csv_engine,
+                               feature_patterns, compact_dtypes, cache, metrics)
+            return folder.name, None, False, m, idf, summarize(folder.name, m)
+
+        entry = previous.get(folder.name)
+        state = input_state(folder, csv_names, entry and entry["inputs"])
+        cells_file, image_file = well_cache / f"{folder.name}.cells.parquet", well_cache / f"{folder.name}.image.parquet"
+        qc_file = well_cache / f"{folder.name}.qc.npz"
+        digests = lambda inputs: {name: f["hash"] for name, f in inputs.items()}
+        if entry and digests(entry["inputs"]) == digests(state) and all(
+                f.exists() for f, present in [(cells_file, entry["cells"]), (image_file, entry["image"])] if present):
+            # Unchanged well: cells already in the Parquet dataset are not even read back
+            in_dataset = output_format == "parquet" and (sc_dataset / f"Metadata_WellID={folder.name}").exists()
+            with metrics.stage("read well cache") as stage:
+                m = pd.read_parquet(cells_file) if entry["cells"] and not in_dataset else None
+                idf = pd.read_parquet(image_file) if entry["image"] else None
+                stage.read((cells_file.stat().st_size if m is not None else 0) +
+                           (image_file.stat().st_size if idf is not None else 0))
+            qc = None
+            if qc_index and entry["cells"]:
+                qc = load_summary(qc_file) if qc_file.exists() else None
+                if qc is None or str(qc["quantiles"]) != qc_quantiles:
+                    # Summary missing or built with other sketch settings: rebuild it from the cached cells
+                    qc = summarize(folder.name, m if m is not None else pd.read_parquet(cells_file))
+                    save_summary(qc_file, qc)
+            return folder.name, dict(entry, inputs=state), True, m, idf, qc
+
+        m, idf = load_well(folder, cell_csv_name, cyto_csv_name, nuc_csv_name, image_csv_name,
+                           csv_engine, feature_patterns, compact_dtypes, cache, metrics)
+        with metrics.stage("write well cache") as stage:
+            for df, f in [(m, cells_file), (idf, image_file)]:
+                if df is not None:
+                    df.to_parquet(f, index=False)
+                    stage.wrote(f.stat().st_size)
+                elif f.exists():
+                    f.unlink()
+        qc = summarize(folder.name, m)
+        if qc is not None:
+            save_summary(qc_file, qc)
+        elif qc_file.exists():
+            qc_file.unlink()
+        return folder.name, {"inputs": state, "cells": m is not None, "image": idf is not None}, False, m, idf, qc
+
+    # Wells are parsed concurrently but consumed in plate order, so the output is unchanged
+    with closing(iter_wells(load, well_folders, num_workers)) as wells:
+        for i, (well_id, entry, cached, m, idf, qc) in enumerate(wells):
+            if entry is not None:
+                manifest[well_id] = entry
+                reused += cached
+            if qc is not None:
+                qc_list.append(qc)
+            if idf is not None:
+                img_list.append(idf)
+            if m is not None:
+                if output_format == "parquet":
+                    with metrics.stage("write output"):
+                        sc_schema = write_well_partition(m, sc_dataset, sc_schema)
+                else:
+                    sc_list.append(m)
+            del m, idf
+
+            if progress_callback:
+                progress_callback.emit(int(((i + 1) / len(well_folders)) * 100))
+            raise_if_cancelled(cancel_token)
+
+    report = ""
+    if incremental:
+        # Drop cached files and dataset partitions of wells that are not in this run's manifest
+        # (removed from the plate, or left over from a run with other load options)
+        for f in well_cache.iterdir():
+            well_id = next((f.name[:-len(suffix)] for suffix in WELL_CACHE_SUFFIXES
+                            if f.name.endswith(suffix)), None)
+            if well_id not in manifest:
+                f.unlink()
+        if sc_dataset.exists():
+            for partition in sc_dataset.glob("Metadata_WellID=*"):
+                if partition.name.split("=", 1)[1] not in manifest:
+                    shutil.rmtree(partition)
+        save_manifest(out_dir, options, manifest)
+        report = f"\nIncremental: {len(manifest) - reused} wells re-merged, {reused} reused from cache"
+    if cache is not None:
+        report += f"\n{cache.summary(since=cache_counters)}"
+    qc_path = out_dir / (Path(final_single_cell_name).stem + "_qc.npz")
+    if qc_list:
+        with metrics.stage("QC index") as stage:
+            build_qc_index(qc_list, qc_path)
+            stage.wrote(qc_path.stat().st_size)
+        report += f"\nQC index: {qc_path}"
+    elif qc_path.exists():
+        qc_path.unlink()
+
+    if output_format == "parquet":
+        if img_list:
+            with metrics.stage("write output") as stage:
+                image_file = out_dir/(Path(final_image_level_name).stem + ".parquet")
+                pd.concat(img_list, ignore_index=True).to_parquet(image_file, index=False)
+                stage.wrote(image_file.stat().st_size)
+        return f"Export Complete!\nSaved to: {out_dir}\nSingle-cell dataset: {sc_dataset}" + report
+
+    for frames, name in [(sc_list, final_single_cell_name), (img_list, final_image_level_name)]:
+        if frames:
+            with metrics.stage("write output") as stage:
+                df = pd.concat(frames, ignore_index=True)
+                df.to_csv(out_dir/name, index=False)
+                stage.wrote((out_dir/name).stat().st_size)
+                if cache is not None and not compact_dtypes:
+                    # Downstream steps reading this CSV through the cache (e.g. normalization) skip the parse
+                    cache.prime(out_dir/name, df, low_memory=False)
+                del df
     
-    return f"Export Complete!\nSaved to: {out_dir}"
\ No newline at end of file
+    return f"Export Complete!\nSaved to: {out_dir}" + report
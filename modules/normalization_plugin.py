@@ -1,15 +1,23 @@
 import os
+import concurrent.futures
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from pycytominer import normalize
 
+from utils.columnar_cache import read_csv_cached
+from utils.metrics import StageMetrics
+from utils.process_pool import PluginProcessPool
+from utils.progress import cancel_pending_on_error, raise_if_cancelled
+from utils.streaming_stats import ColumnQuantileSketch, RunningMoments
+
 # Metadata Standards [cite: 41, 42, 43, 44]
 NAME = "Well-Level Normalization"
 DESCRIPTION = "Apply MAD-Robustize and Standardization to merged well-level CSVs."
 
-def load_dtype_map(dtype_path: Path):
+def load_dtype_map(dtype_path: Path, use_cache: bool = False):
     """Internal helper to categorize columns based on the provided spec."""
-    dtype_df = pd.read_csv(dtype_path)
+    dtype_df = read_csv_cached(dtype_path) if use_cache else pd.read_csv(dtype_path)
     col_name_field = "Column_Name" if "Column_Name" in dtype_df.columns else "ColumnName"
     col_type_field = "Column_Type" if "Column_Type" in dtype_df.columns else "ColumnType"
     
@@ -22,15 +30,178 @@ def load_dtype_map(dtype_path: Path):
                     if ctype != "metadata" and not col.startswith("Metadata_")]
     return metadata_cols, feature_cols
 
-def run(data_path: str, column_dtypes_path: str = "CSVs/column_dtypes.csv", progress_callback=None):
+def scaling_stats(median, mad, mean, var, n):
+    """
+    Per-feature shifts and scales mirroring pycytominer's defaults (samples="all"):
+    MAD scaled by 1.4826 with a 1e-18 epsilon, and population std with constant
+    features left unscaled (same near-constant test as sklearn's StandardScaler).
+    """
+    eps = np.finfo(np.float64).eps
+    std = np.where(var <= n * eps * var + (n * mean * eps) ** 2, 1.0, np.sqrt(var))
+    return {"median": np.float32(median), "mad": np.float32(mad * 1.4826) + np.float32(1e-18),
+            "mean": np.float32(mean), "std": np.float32(std)}
+
+def apply_scaling(features_df: pd.DataFrame, stats: dict):
+    """Returns (mad_df, std_df) for a float32 feature block using precomputed stats."""
+    X = features_df.to_numpy(dtype=np.float32)
+    return (pd.DataFrame((X - stats["median"]) / stats["mad"], index=features_df.index, columns=features_df.columns),
+            pd.DataFrame((X - stats["mean"]) / stats["std"], index=features_df.index, columns=features_df.columns))
+
+def native_normalize(features_df: pd.DataFrame):
+    """
+    Computes mad_robustize and standardize together from a single float32 copy of the
+    feature matrix. Returns (mad_df, std_df) with the same index and columns as features_df.
+    """
+    X = features_df.to_numpy(dtype=np.float32)
+    median = np.nanmedian(X, axis=0)
+    stats = scaling_stats(median, np.nanmedian(np.abs(X - median), axis=0),
+                          np.nanmean(X, axis=0, dtype=np.float64), np.nanvar(X, axis=0, dtype=np.float64),
+                          np.sum(~np.isnan(X), axis=0))
+    return apply_scaling(features_df, stats)
+
+def iter_chunks(csv_file: Path, usecols: list, chunk_size: int, step_callback=None):
+    """
+    Yields (index, chunk) of a CSV read chunk_size rows at a time. After every chunk,
+    step_callback(fraction) is called with the share of the file read so far (from the
+    file position, so approximate), which lets run() report progress and cancel mid-pass.
+    """
+    total = max(csv_file.stat().st_size, 1)
+    with open(csv_file, "rb") as f:
+        for i, chunk in enumerate(pd.read_csv(f, usecols=usecols, chunksize=chunk_size, low_memory=False)):
+            yield i, chunk
+            if step_callback:
+                step_callback(min(f.tell() / total, 0.99))
+
+def normalize_file_chunked(csv_file: Path, metadata_cols: list, feature_cols: list, chunk_size: int,
+                           sketch_error: float = 0.001, step_callback=None):
+    """
+    Out-of-core variant of normalize_file for tables larger than RAM. Pass one streams the
+    file in chunks, accumulating exact mean/std and a mergeable quantile sketch for
+    median/MAD (rank error ~sketch_error). Pass two streams it again and appends both
+    normalized outputs chunk by chunk, so memory is bounded by chunk_size rows.
+    Each pass is one step: step_callback(fraction) is called after every chunk and
+    step_callback() once the pass is complete.
+    """
+    header = pd.read_csv(csv_file, nrows=0).columns
+    present_features = [c for c in feature_cols if c in header]
+    present_metadata = [c for c in metadata_cols if c in header]
+    usecols = present_metadata + present_features
+
+    # Pass one: statistics
+    moments = RunningMoments(len(present_features))
+    sketch = ColumnQuantileSketch(len(present_features), error=sketch_error)
+    for _, chunk in iter_chunks(csv_file, usecols, chunk_size, step_callback):
+        X = chunk[present_features].to_numpy(dtype=np.float64)
+        moments.update(X)
+        sketch.update(X)
+    median, mad = sketch.median_mad()
+    stats = scaling_stats(median, mad, moments.mean, moments.var, moments.n)
+    if step_callback:
+        step_callback()
+
+    # Pass two: normalize and append
+    outputs = [csv_file.parent / (csv_file.stem + suffix + ".csv") for suffix in ("_mad", "_std")]
+    for i, chunk in iter_chunks(csv_file, usecols, chunk_size, step_callback):
+        for output_path, features_df in zip(outputs, apply_scaling(chunk[present_features], stats)):
+            normalized_df = pd.concat([chunk[present_metadata], features_df], axis=1)
+            normalized_df.to_csv(output_path, index=False, mode="w" if i == 0 else "a", header=(i == 0))
+    if step_callback:
+        step_callback()
+
+def normalize_file(csv_file: Path, metadata_cols: list, feature_cols: list, engine: str = "pycytominer",
+                   step_callback=None, chunk_size: int = 0, sketch_error: float = 0.001, use_cache: bool = False,
+                   metrics=None):
+    """Normalizes one *_joined.csv and writes its _mad and _std outputs next to it."""
+    metrics = metrics if metrics is not None else StageMetrics()
+    outputs = [csv_file.parent / (csv_file.stem + suffix + ".csv") for suffix in ("_mad", "_std")]
+    if chunk_size > 0:
+        with metrics.stage("normalize (chunked)") as stage:
+            normalize_file_chunked(csv_file, metadata_cols, feature_cols, chunk_size, sketch_error, step_callback)
+            # Two streaming passes over the input
+            stage.read(2 * csv_file.stat().st_size)
+            stage.wrote(sum(p.stat().st_size for p in outputs))
+        return
+
+    with metrics.stage("read CSV") as stage:
+        if use_cache:
+            profiles_df = read_csv_cached(csv_file, low_memory=False)
+        else:
+            profiles_df = pd.read_csv(csv_file, low_memory=False)
+        stage.read(csv_file.stat().st_size)
+
+    # Identify columns present in this specific file
+    present_features = [c for c in feature_cols if c in profiles_df.columns]
+    present_metadata = [c for c in metadata_cols if c in profiles_df.columns]
+
+    methods = ["mad_robustize", "standardize"]
+    suffixes = ["_mad", "_std"]
+
+    if engine == "native":
+        # Both methods from one pass over the feature matrix
+        with metrics.stage("normalize"):
+            results = native_normalize(profiles_df[present_features])
+            normalized = [pd.concat([profiles_df[present_metadata], df], axis=1) for df in results]
+    else:
+        normalized = None
+
+    for i, (method, suffix) in enumerate(zip(methods, suffixes)):
+        if step_callback:
+            step_callback()
+
+        if normalized is not None:
+            normalized_df = normalized[i]
+        else:
+            # Perform Normalization
+            with metrics.stage("normalize"):
+                normalized_df = normalize(
+                    profiles=profiles_df,
+                    features=present_features,
+                    meta_features=present_metadata,
+                    method=method,
+                    output_file=None,
+                )
+
+        # Reorder: metadata first, then features
+        ordered_cols = present_metadata + [c for c in present_features if c in normalized_df.columns]
+        normalized_df = normalized_df.loc[:, ordered_cols]
+
+        # Export with distinct naming convention
+        output_path = outputs[i]
+        with metrics.stage("write output") as stage:
+            normalized_df.to_csv(output_path, index=False)
+            stage.wrote(output_path.stat().st_size)
+
+def run(data_path: str, column_dtypes_path: str = "CSVs/column_dtypes.csv", engine: str = "pycytominer",
+        num_workers: int = 1, chunk_size: int = 0, sketch_error: float = 0.001, use_columnar_cache: bool = False,
+        metrics=None, cancel_token=None, progress_callback=None):
     """
     Standard Plugin Contract [cite: 10, 11, 21]
     
     Args:
         data_path: Automatically receives selected directory [cite: 16]
         column_dtypes_path: Path to the CSV defining feature/metadata types [cite: 32]
+        engine: 'pycytominer' or 'native'. The native engine computes median/MAD and mean/std for
+            all features in one vectorized float32 pass and writes both outputs from it; results
+            match pycytominer to float32 precision.
+        num_workers: Number of *_joined.csv files normalized in parallel worker processes.
+        chunk_size: When > 0, stream each file in chunks of this many rows in two passes
+            (statistics, then normalization) so files larger than RAM can be processed.
+            Mean/std are exact; median/MAD come from a quantile sketch. Ignores engine.
+        sketch_error: Rank error bound of the median/MAD sketch in chunked mode.
+        use_columnar_cache: Read inputs through the shared columnar cache (utils.columnar_cache), so
+            re-normalizing the same joined CSVs skips CSV parsing. Not used in chunked mode.
+        metrics: utils.metrics.StageMetrics recording reading, normalization and writing
+            (injected by the app). Parallel runs record the worker processes as one stage.
+        cancel_token: Checked after every normalization step (and every chunk in chunked mode);
+            on cancellation files not yet started are dropped.
         progress_callback: PyQt signal for UI progress bar updates [cite: 17, 40]
     """
+    metrics = metrics if metrics is not None else StageMetrics()
+    engine = engine.strip().lower()
+    if engine not in ("pycytominer", "native"):
+        return f"Error: Unknown normalization engine '{engine}'. Use 'pycytominer' or 'native'."
+    if chunk_size > 0 and not 0 < sketch_error < 1:
+        return f"Error: Sketch error must be between 0 and 1 (exclusive), got {sketch_error}."
     input_dir = Path(data_path)
     dtype_path = Path(column_dtypes_path)
     
@@ -38,7 +209,8 @@ def run(data_path: str, column_dtypes_path: str = "CSVs/column_dtypes.csv", prog
         raise FileNotFoundError(f"Column dtypes not found at {column_dtypes_path}")
 
     # Load column definitions
-    metadata_cols, feature_cols = load_dtype_map(dtype_path)
+    with metrics.stage("load column dtypes"):
+        metadata_cols, feature_cols = load_dtype_map(dtype_path, use_columnar_cache)
     
     # Identify all merged CSVs in the folder
     csv_files = list(input_dir.glob("*_joined.csv"))
@@ -49,39 +221,35 @@ def run(data_path: str, column_dtypes_path: str = "CSVs/column_dtypes.csv", prog
     total_steps = len(csv_files) * 2
     current_step = 0
 
-    for csv_file in csv_files:
-        profiles_df = pd.read_csv(csv_file, low_memory=False)
-        
-        # Identify columns present in this specific file
-        present_features = [c for c in feature_cols if c in profiles_df.columns]
-        present_metadata = [c for c in metadata_cols if c in profiles_df.columns]
+    def step(fraction=None):
+        # Update Progress [cite: 40, 48]; a fraction reports progress within the next step
+        nonlocal current_step
+        if fraction is None:
+            current_step += 1
+        if progress_callback:
+            progress = int(((current_step + (fraction or 0)) / total_steps) * 100)
+            progress_callback.emit(progress)
+        raise_if_cancelled(cancel_token)
 
-        methods = ["mad_robustize", "standardize"]
-        suffixes = ["_mad", "_std"]
+    if num_workers <= 1 or len(csv_files) == 1:
+        for csv_file in csv_files:
+            normalize_file(csv_file, metadata_cols, feature_cols, engine, step, chunk_size, sketch_error,
+                           use_columnar_cache, metrics)
+    else:
+        # Files are independent: one worker process per file, progress as each one finishes
+        with metrics.stage("normalize files (workers)") as stage, \
+                PluginProcessPool(__file__, max_workers=min(num_workers, len(csv_files))) as pool, \
+                cancel_pending_on_error(pool):
+            futures = {pool.submit_plugin("normalize_file", csv_file, metadata_cols, feature_cols, engine,
+                                          None, chunk_size, sketch_error, use_columnar_cache): csv_file
+                       for csv_file in csv_files}
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                csv_file = futures[future]
+                stage.read(csv_file.stat().st_size)
+                stage.wrote(sum((csv_file.parent / (csv_file.stem + suffix + ".csv")).stat().st_size
+                                for suffix in ("_mad", "_std")))
+                step()
+                step()
 
-        for method, suffix in zip(methods, suffixes):
-            # Update Progress [cite: 40, 48]
-            if progress_callback:
-                current_step += 1
-                progress = int((current_step / total_steps) * 100)
-                progress_callback.emit(progress)
-
-            # Perform Normalization
-            normalized_df = normalize(
-                profiles=profiles_df,
-                features=present_features,
-                meta_features=present_metadata,
-                method=method,
-                output_file=None,
-            )
-
-            # Reorder: metadata first, then features
-            ordered_cols = present_metadata + [c for c in present_features if c in normalized_df.columns]
-            normalized_df = normalized_df.loc[:, ordered_cols]
-
-            # Export with distinct naming convention
-            output_name = csv_file.stem + suffix + ".csv"
-            output_path = input_dir / output_name
-            normalized_df.to_csv(output_path, index=False)
-            
     print(f"Successfully processed {len(csv_files)} files using both methods.")
\ No newline at end of file
@@ -1,31 +1,305 @@
 import re
+import time
+import threading
 import concurrent.futures
+from contextlib import closing
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
 import numpy as np
-from skimage import filters, io
+import tifffile
+from skimage import io
+
+from utils.focus_cache import FocusScoreCache
+from utils.focus_metrics import FOCUS_METRICS, metric_key, score_stack
+from utils.image_index import IMAGE_PATTERN, ImageIndex
+from utils.metrics import StageMetrics
+from utils.process_pool import PluginProcessPool, SharedArray, write_shared_array
+from utils.progress import cancel_pending_on_error, raise_if_cancelled
+from utils.tiff_io import BackgroundWriter, PlaneRegionReader, map_plane
 
 # 1. Metadata Standards for UI Labeling [cite: 42-44]
 NAME = "Smart MIP Filter"
 DESCRIPTION = "Generates MIPs by filtering out-of-focus planes. Now with custom output directory support."
 
+def read_plane(path, use_mmap=False):
+    """
+    Reads a single Z-plane, keeping only the first sample of multi-channel TIFFs.
+    With use_mmap, uncompressed TIFFs are memory-mapped (read-only) instead of decoded.
+    """
+    img = map_plane(path) if use_mmap else None
+    if img is None:
+        img = io.imread(path)
+    if img.ndim > 2: img = img[..., 0]
+    return img
+
+def output_folders(base_path):
+    """
+    Output folders of earlier runs under base_path (with any output_folder_name), recognised
+    by the image index / focus score files written next to them. Their MIPs are named like
+    Z000 planes and must not be indexed as input.
+    """
+    folders = set()
+    for suffix in ("_image_index.json", "_focus_scores.sqlite"):
+        for marker in Path(base_path).glob(f"*{suffix}"):
+            folder = marker.with_name(marker.name[:-len(suffix)])
+            if folder.is_dir():
+                folders.add(folder)
+    return sorted(folders)
+
+def mip_output_name(path):
+    """Use regex to rename Z-plane to Z000 for the MIP output."""
+    return re.sub(r'Z\d{3}', 'Z000', Path(path).name)
+
+def compute_mip(paths, scoring, threshold_pct, streaming=False, known_scores=None, reader=read_plane):
+    """
+    Builds the filtered MIP for one Z-ordered stack.
+
+    In-memory mode keeps every decoded plane until the MIP is taken. Streaming mode
+    runs two passes instead: pass one scores each plane and discards its pixels, pass
+    two re-reads only the accepted planes and folds them into one in-place np.maximum
+    accumulator, so at most two planes are alive at once.
+
+    scoring is (method, reduction factor, reduction mode) for utils.focus_metrics.
+    known_scores (aligned with paths, None = unknown) comes from the focus score cache;
+    planes with a known score are only read if they pass the threshold.
+    reader(path) returns a plane; the pipelined mode passes one backed by prefetched planes.
+
+    Returns:
+        (mip_img or None, path of the first accepted plane, stats dict with
+        'peak_planes' and 'peak_bytes' held by this worker for the stack,
+        'planes_read' and the full 'scores' list).
+    """
+    stats = {'peak_planes': 0, 'peak_bytes': 0, 'planes_read': 0}
+    scores = list(known_scores) if known_scores is not None else [None] * len(paths)
+    loaded = {}
+
+    # Pass one: score every plane the cache does not know
+    unknown = [i for i, score in enumerate(scores) if score is None]
+    if streaming:
+        for i in unknown:
+            img = reader(paths[i])
+            stats['planes_read'] += 1
+            scores[i] = score_stack(img[np.newaxis], *scoring)[0]
+            # Pixels are released after each plane
+            stats['peak_planes'] = max(stats['peak_planes'], 1)
+            stats['peak_bytes'] = max(stats['peak_bytes'], img.nbytes)
+            del img
+    elif unknown:
+        # Decode straight into one (Z, Y, X) block and score it batched
+        first = reader(paths[unknown[0]])
+        block = np.empty((len(unknown),) + first.shape, dtype=first.dtype)
+        block[0] = first
+        del first
+        for j, i in enumerate(unknown[1:], 1):
+            block[j] = reader(paths[i])
+        stats['planes_read'] += len(unknown)
+        for i, score in zip(unknown, score_stack(block, *scoring)):
+            scores[i] = score
+        loaded = {i: block[j] for j, i in enumerate(unknown)}
+    stats['scores'] = scores
+
+    threshold = np.max(scores) * (threshold_pct / 100.0)
+    accepted = [i for i, score in enumerate(scores) if score >= threshold]
+    if not accepted:
+        return None, None, stats
+
+    if streaming:
+        # Pass two: running maximum over the accepted planes only
+        mip_img = None
+        for i in accepted:
+            img = reader(paths[i])
+            stats['planes_read'] += 1
+            if mip_img is None:
+                mip_img = img if img.flags.writeable else img.copy()
+                continue
+            stats['peak_planes'] = max(stats['peak_planes'], 2)
+            stats['peak_bytes'] = max(stats['peak_bytes'], mip_img.nbytes + img.nbytes)
+            np.maximum(mip_img, img, out=mip_img)
+            del img
+    else:
+        for i in accepted:
+            if i not in loaded:
+                loaded[i] = reader(paths[i])
+                stats['planes_read'] += 1
+        valid = np.stack([loaded[i] for i in accepted])
+        stats['peak_planes'] = len(loaded)
+        stats['peak_bytes'] = sum(img.nbytes for img in loaded.values()) + valid.nbytes
+        mip_img = np.max(valid, axis=0)
+
+    return mip_img, paths[accepted[0]], stats
+
+def process_stack(paths, scoring, known_scores, threshold_pct, mip_dir, streaming=False):
+    """Thread-pool worker: builds one MIP and writes it to mip_dir."""
+    mip_img, source, stats = compute_mip(paths, scoring, threshold_pct, streaming, known_scores)
+    if mip_img is not None:
+        io.imsave(Path(mip_dir) / mip_output_name(source), mip_img, check_contrast=False)
+    return stats
+
+def process_stack_shared(paths, scoring, known_scores, threshold_pct, streaming, handle):
+    """
+    Process-pool worker: builds one MIP and copies it into the parent's shared memory
+    block instead of pickling it. Stacks whose plane shape differs from the block are
+    returned inline as a fallback.
+    """
+    mip_img, source, stats = compute_mip(paths, scoring, threshold_pct, streaming, known_scores)
+    if mip_img is None:
+        return None, None, stats
+    if write_shared_array(handle, mip_img):
+        return mip_output_name(source), None, stats
+    return mip_output_name(source), mip_img, stats
+
+def process_stack_tiled(paths, scoring, known_scores, threshold_pct, mip_dir, tile_size):
+    """
+    Tiled mode: focus scoring and plane selection run per tile_size x tile_size tile, so
+    a tilted sample gets locally in-focus planes, and the MIP is written tile by tile into
+    a memory-mapped output TIFF. Planes are never decoded whole: uncompressed planes are
+    memory-mapped and compressed ones are decoded strip by strip or tile by tile
+    (utils.tiff_io.PlaneRegionReader), so memory scales with Z x tile (Z x full-width
+    strips for striped files) rather than with the field. Per-tile scores bypass the
+    focus score cache.
+    """
+    readers = [PlaneRegionReader(path) for path in paths]
+    try:
+        h, w = readers[0].shape
+        dtype = readers[0].dtype
+        mip_img = tifffile.memmap(Path(mip_dir) / mip_output_name(paths[0]), shape=(h, w), dtype=dtype)
+
+        block = np.empty((len(readers), min(tile_size, h), min(tile_size, w)), dtype=dtype)
+        for y in range(0, h, tile_size):
+            for x in range(0, w, tile_size):
+                tile = block[:, :min(tile_size, h - y), :min(tile_size, w - x)]
+                for z, reader in enumerate(readers):
+                    tile[z] = reader.read(y, y + tile.shape[1], x, x + tile.shape[2])
+                scores = score_stack(tile, *scoring)
+                if np.isnan(scores).all():
+                    # Too small to score (e.g. a 1 px edge strip): keep every plane
+                    accepted = np.ones(len(scores), dtype=bool)
+                else:
+                    accepted = scores >= np.nanmax(scores) * (threshold_pct / 100.0)
+                mip_img[y:y + tile.shape[1], x:x + tile.shape[2]] = tile[accepted].max(axis=0)
+        mip_img.flush()
+        del mip_img
+    finally:
+        for reader in readers:
+            reader.close()
+
+    # No plane is ever held whole; peak_bytes is the tile block plus the decoded chunks
+    return {'peak_planes': 0, 'planes_read': len(paths),
+            'peak_bytes': block.nbytes + sum(reader.peak_bytes for reader in readers)}
+
+def prefetch_stack(paths, known_scores, threshold_pct):
+    """
+    Read-ahead stage of the pipelined mode: maps (or decodes, for compressed TIFFs) every
+    plane the compute stage may touch. Planes whose cached score is already below the
+    threshold implied by the other cached scores are skipped.
+    """
+    known_scores = known_scores or [None] * len(paths)
+    known = [score for score in known_scores if score is not None]
+    floor = max(known) * (threshold_pct / 100.0) if known else None
+    return {path: read_plane(path, use_mmap=True)
+            for path, score in zip(paths, known_scores)
+            if score is None or score >= floor}
+
+def run_pipeline(stacks, threshold_pct, mip_dir, streaming, num_workers, read_ahead_depth, write_queue_depth):
+    """
+    Three-stage pipeline: a bounded read-ahead stage prefetches upcoming stacks, the
+    compute stage builds MIPs on num_workers threads, and a dedicated writer thread saves
+    them from a bounded queue. Yields (stack, stats) in submission order.
+    """
+    # Stacks being prefetched or computed; released once the MIP is queued for writing
+    slots = threading.Semaphore(max(read_ahead_depth, 0) + num_workers)
+
+    def compute(stack, loading):
+        paths, scoring, known_scores = stack
+        try:
+            planes = loading.result()
+            mip_img, source, stats = compute_mip(paths, scoring, threshold_pct, streaming, known_scores,
+                                                 reader=lambda p: planes[p] if p in planes else read_plane(p))
+            # Prefetched planes that had to be decoded (not memory-mapped) were held as well
+            decoded = [plane for plane in planes.values() if not isinstance(plane, np.memmap)]
+            stats['peak_planes'] += len(decoded)
+            stats['peak_bytes'] += sum(plane.nbytes for plane in decoded)
+            del planes, decoded
+        finally:
+            slots.release()
+        if mip_img is not None:
+            writer.put(Path(mip_dir) / mip_output_name(source), mip_img)
+        return stats
+
+    write_mip = lambda path, img: io.imsave(path, img, check_contrast=False)
+    with BackgroundWriter(write_mip, write_queue_depth) as writer, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(read_ahead_depth, 1)) as read_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as compute_pool, \
+            cancel_pending_on_error(read_pool, compute_pool):
+        in_flight = deque()
+        for stack in stacks:
+            slots.acquire()
+            loading = read_pool.submit(prefetch_stack, stack[0], stack[2], threshold_pct)
+            in_flight.append((stack, compute_pool.submit(compute, stack, loading)))
+            while in_flight and in_flight[0][1].done():
+                done_stack, future = in_flight.popleft()
+                yield done_stack, future.result()
+        while in_flight:
+            done_stack, future = in_flight.popleft()
+            yield done_stack, future.result()
+
 # 2. Plugin Contract: The run Signature [cite: 10-14]
 def run(data_path: str, 
         output_folder_name: str = "Filtered_MIPs",
         methods_mapping: str = "1:laplacian, 2:variance", 
         threshold_pct: int = 75, 
         num_workers: int = 4,
+        streaming_mip: bool = False,
+        executor: str = "thread",
+        use_focus_cache: bool = True,
+        reset_focus_cache: bool = False,
+        incremental: bool = False,
+        score_reduction: int = 1,
+        score_reduction_mode: str = "downsample",
+        pipelined: bool = False,
+        read_ahead_depth: int = 4,
+        write_queue_depth: int = 8,
+        tile_size: int = 0,
+        metrics=None,
+        cancel_token=None,
         progress_callback=None):
     """
     Args:
         data_path: str: Automatically receives the selected directory.
         output_folder_name: str: Name of the sub-folder for results (UI: QLineEdit)[cite: 31, 32].
-        methods_mapping: str: Maps channels to methods (e.g., '1:laplacian').
+        methods_mapping: str: Maps channels to methods (e.g., '1:laplacian'). Any metric registered
+            in utils.focus_metrics is accepted: laplacian, variance, tenengrad, brenner.
         threshold_pct: int: Focus score threshold (UI: QSpinBox)[cite: 31, 32].
         num_workers: int: CPU threads for parallel processing.
+        streaming_mip: bool: Two-pass mode that scores planes first and then folds only the
+            accepted planes into a running maximum, holding ~2 planes per worker (UI: QCheckBox).
+        executor: str: 'thread' or 'process'. Process mode runs stacks in worker processes so
+            decoding and focus scoring are not serialized by the GIL; MIPs come back through shared memory.
+        use_focus_cache: bool: Persist per-plane focus scores next to the output folder so reruns
+            with a new threshold only read the planes that pass it.
+        reset_focus_cache: bool: Invalidate every cached score before this run.
+        incremental: bool: Only process new or changed stacks; stacks that already have a MIP
+            in the output folder and whose planes are unchanged since the last run are skipped.
+        score_reduction: int: Score planes at 1/N resolution (or on the central 1/N crop); the MIP
+            itself is always built at full resolution. 1 disables the reduction.
+        score_reduction_mode: str: 'downsample' (N x N binning) or 'crop'.
+        pipelined: bool: Overlap I/O and compute (thread executor): stacks are prefetched ahead of
+            the workers, memory-mapping uncompressed TIFFs, and MIPs are saved by a dedicated writer.
+            Compressed stacks are decoded whole ahead of time, so this cannot be combined with
+            streaming_mip.
+        read_ahead_depth: int: Stacks prefetched ahead of the compute stage in pipelined mode.
+        write_queue_depth: int: MIPs that may wait for the writer before workers block.
+        tile_size: int: When > 0, select in-focus planes per tile_size x tile_size tile and build
+            the MIP tile by tile, bounding memory by the tile size for very large fields.
+        metrics: utils.metrics.StageMetrics recording the discovery, cache lookup, MIP and
+            bookkeeping stages (injected by the app).
+        cancel_token: Checked after every stack; on cancellation queued stacks are dropped and
+            only the stacks already running are finished.
         progress_callback: Emits PyQt signals to update the UI[cite: 17, 40].
     """
     
+    metrics = metrics if metrics is not None else StageMetrics()
+
     # --- Output Directory Logic ---
     # We combine the base data_path with the user-defined folder name
     base_path = Path(data_path)
@@ -40,57 +314,183 @@ def run(data_path: str,
     except Exception:
         return "Error: Invalid mapping format. Use 'ChannelID:Method, ChannelID:Method'."
 
+    unknown = sorted(set(metric_config.values()) - set(FOCUS_METRICS))
+    if unknown:
+        return f"Error: Unknown focus method(s) {', '.join(unknown)}. Available: {', '.join(sorted(FOCUS_METRICS))}."
+
+    score_reduction_mode = score_reduction_mode.strip().lower()
+    if score_reduction_mode not in ("downsample", "crop"):
+        return "Error: Invalid score reduction mode. Use 'downsample' or 'crop'."
+
+    executor = executor.strip().lower()
+    if executor not in ("thread", "process"):
+        return "Error: Invalid executor. Use 'thread' or 'process'."
+    if pipelined and executor != "thread":
+        return "Error: Pipelined mode runs on the thread executor."
+    if pipelined and tile_size > 0:
+        return "Error: Tiled mode cannot be combined with pipelined mode."
+    if pipelined and streaming_mip:
+        # Read-ahead holds whole stacks, which defeats streaming's ~2 planes per worker
+        return "Error: Streaming mode cannot be combined with pipelined mode."
+
     # --- Discovery Phase [cite: 35] ---
-    pattern = re.compile(r'W(\d+)F(\d+)T(\d+)Z(\d+)C(\d+)\.tif')
-    groups = defaultdict(list)
-    for p in base_path.rglob('*.tif'):
-        m = pattern.match(p.name)
-        if m:
-            w, f, t, z, c = map(int, m.groups())
+    # Parallel, manifest-backed scan; the output folder itself is never indexed
+    index = ImageIndex(base_path, mip_dir.with_name(f"{mip_dir.name}_image_index.json"),
+                       exclude=[mip_dir, *output_folders(base_path)])
+    stack_key = lambda rec: (rec[0], rec[1], rec[4])
+    previous = index.signatures(stack_key) if incremental else {}
+    plane_sizes = {}
+    with metrics.stage("discovery"):
+        # Incremental runs must also notice planes rewritten in place before skipping a stack
+        index.refresh(verify_files=incremental)
+
+        groups = defaultdict(list)
+        for w, f, t, z, c, p, size, mtime_ns in index.records():
             if c in metric_config:
                 groups[(w, f, c)].append({'path': p, 'z': z})
+                plane_sizes[p] = size
 
     if not groups:
         return f"No matching images found in {data_path} for the specified channels."
 
-    tasks = list(groups.items())
-    total = len(tasks)
-
-    # --- Internal Worker Logic ---
-    def process_group(item):
-        (well, field, channel), images = item
-        images.sort(key=lambda x: x['z'])
-        method = metric_config[channel]
-        
-        focus_results = []
-        for img_data in images:
-            img = io.imread(img_data['path'])
-            if img.ndim > 2: img = img[..., 0]
-            
-            # Focus Calculation logic
-            if method == 'laplacian':
-                score = np.var(filters.laplace(img))
-            else:
-                score = np.var(img) / np.mean(img) if np.mean(img) != 0 else 0
-            
-            focus_results.append({'score': score, 'image': img, 'path': img_data['path']})
+    # Incremental: skip stacks whose planes are unchanged and whose MIP already exists
+    skipped = 0
+    if incremental:
+        current = index.signatures(stack_key)
+        existing = set()
+        for out in mip_dir.glob('*.tif'):
+            m = IMAGE_PATTERN.match(out.name)
+            if m:
+                w, f, t, z, c = map(int, m.groups())
+                existing.add((w, f, c))
+        for key in list(groups):
+            if key in existing and previous.get(key) == current[key]:
+                del groups[key]
+                skipped += 1
+        if not groups:
+            index.save()
+            return f"All {skipped} stacks are up to date. Results in: {mip_dir}"
 
-        scores = np.array([r['score'] for r in focus_results])
-        threshold = np.max(scores) * (threshold_pct / 100.0)
-        valid_planes = [r for r in focus_results if r['score'] >= threshold]
+    # --- Focus Score Cache ---
+    cache = None
+    if use_focus_cache and tile_size <= 0:
+        cache = FocusScoreCache(mip_dir.with_name(f"{mip_dir.name}_focus_scores.sqlite"))
+        if reset_focus_cache:
+            cache.clear()
 
-        if valid_planes:
-            mip_img = np.max(np.stack([r['image'] for r in valid_planes]), axis=0)
-            # Use regex to rename Z-plane to Z000 for the MIP output
-            mip_name = re.sub(r'Z\d{3}', 'Z000', valid_planes[0]['path'].name)
-            io.imsave(mip_dir / mip_name, mip_img, check_contrast=False)
-        return True
+    stacks = []
+    with metrics.stage("focus cache lookup"):
+        for (well, field, channel), images in groups.items():
+            images.sort(key=lambda x: x['z'])
+            paths = [img['path'] for img in images]
+            scoring = (metric_config[channel], score_reduction, score_reduction_mode)
+            known_scores = cache.lookup(paths, metric_key(*scoring)) if cache else None
+            stacks.append((paths, scoring, known_scores))
+    total = len(stacks)
 
     # --- Execution Workflow [cite: 33, 34, 39] ---
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-        for i, _ in enumerate(executor.map(process_group, tasks)):
-            if progress_callback:
-                # Signal communication between Worker and GUI 
-                progress_callback.emit(int(((i + 1) / total) * 100))
+    peak_planes, peak_bytes = 0, 0
+    planes_read = 0
+    bytes_read = 0
+    done = 0
+
+    def record(stack, stats):
+        nonlocal peak_planes, peak_bytes, planes_read, bytes_read, done
+        paths, scoring, known_scores = stack
+        peak_planes = max(peak_planes, stats['peak_planes'])
+        peak_bytes = max(peak_bytes, stats['peak_bytes'])
+        planes_read += stats['planes_read']
+        # Planes of a stack share their size, so the mean file size is exact here
+        bytes_read += stats['planes_read'] * sum(plane_sizes[p] for p in paths) / len(paths)
+        if cache:
+            new = [i for i, score in enumerate(known_scores) if score is None]
+            cache.store([paths[i] for i in new], metric_key(*scoring), [stats['scores'][i] for i in new])
+        done += 1
+        if progress_callback:
+            # Signal communication between Worker and GUI 
+            progress_callback.emit(int((done / total) * 100))
+        raise_if_cancelled(cancel_token)
+
+    stage_start = time.time()
+    with metrics.stage("build MIPs") as stage:
+        if tile_size > 0:
+            # Workers write their own output tile by tile, in threads or processes
+            if executor == "thread":
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+                submit = lambda *args: pool.submit(process_stack_tiled, *args)
+            else:
+                pool = PluginProcessPool(__file__, max_workers=num_workers)
+                submit = lambda *args: pool.submit_plugin('process_stack_tiled', *args)
+            with pool, cancel_pending_on_error(pool):
+                futures = {submit(*stack, threshold_pct, mip_dir, tile_size): stack for stack in stacks}
+                for future in concurrent.futures.as_completed(futures):
+                    record(futures[future], future.result())
+        elif pipelined:
+            with closing(run_pipeline(stacks, threshold_pct, mip_dir, streaming_mip, num_workers,
+                                      read_ahead_depth, write_queue_depth)) as pipeline:
+                for stack, stats in pipeline:
+                    record(stack, stats)
+        elif executor == "thread":
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as pool, \
+                    cancel_pending_on_error(pool):
+                for stack, stats in zip(stacks, pool.map(
+                        lambda s: process_stack(*s, threshold_pct, mip_dir, streaming_mip), stacks)):
+                    record(stack, stats)
+        else:
+            # One reusable output buffer per in-flight stack, sized from the first plane
+            probe = read_plane(stacks[0][0][0])
+            buffers = [SharedArray(probe.shape, probe.dtype) for _ in range(min(2 * num_workers, total))]
+            free, pending = list(buffers), {}
+            todo = stacks[::-1]
+            try:
+                with PluginProcessPool(__file__, max_workers=num_workers) as pool, cancel_pending_on_error(pool):
+                    while todo or pending:
+                        while todo and free:
+                            buf = free.pop()
+                            stack = todo.pop()
+                            future = pool.submit_plugin('process_stack_shared', *stack,
+                                                        threshold_pct, streaming_mip, buf.handle)
+                            pending[future] = (stack, buf)
+                        finished, _ = concurrent.futures.wait(
+                            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in finished:
+                            stack, buf = pending.pop(future)
+                            mip_name, inline_img, stats = future.result()
+                            if mip_name:
+                                mip_img = buf.array if inline_img is None else inline_img
+                                io.imsave(mip_dir / mip_name, mip_img, check_contrast=False)
+                                del mip_img
+                            free.append(buf)
+                            record(stack, stats)
+            finally:
+                for buf in buffers:
+                    buf.release()
+        stage.read(int(bytes_read))
+        stage.wrote(sum(st.st_size for st in (out.stat() for out in mip_dir.glob('*.tif'))
+                        if st.st_mtime >= stage_start))
+
+    with metrics.stage("save index and cache"):
+        index.save()
+
+        cache_report = ""
+        if cache:
+            evicted = cache.retain(rec[5] for rec in index.records())
+            cache_report = f"\n{cache.summary()}, {evicted} stale entries evicted"
+            cache.close()
 
-    return f"Completed MIPs for {total} stacks. Results saved in: {mip_dir}"
\ No newline at end of file
+    # --- Memory Report ---
+    workers = min(num_workers, total)
+    # Prefetched stacks waiting for a worker hold their planes too
+    in_flight = min(workers + (max(read_ahead_depth, 0) if pipelined else 0), total)
+    mode = ("streaming" if streaming_mip else "in-memory") + f", {executor} executor"
+    if tile_size > 0:
+        mode = f"tiled {tile_size}px, {executor} executor"
+    if pipelined:
+        mode += f", pipelined (read-ahead {read_ahead_depth}, write queue {write_queue_depth})"
+    return (f"Completed MIPs for {total} stacks. Results saved in: {mip_dir}\n"
+            f"Peak plane memory per worker ({mode}): {peak_planes} planes, "
+            f"{peak_bytes / 1e6:.1f} MB (~{peak_bytes * in_flight / 1e6:.1f} MB across {in_flight} "
+            f"{'stacks in flight' if pipelined else 'workers'})\n"
+            f"Planes read: {planes_read}\n"
+            f"Discovery: {len(index.dirs)} directories ({index.rescanned} re-listed), "
+            f"{skipped} stacks skipped as up to date" + cache_report)
\ No newline at end of file
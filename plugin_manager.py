@@ -1,19 +1,109 @@
 import os
+import ast
+import json
 import inspect
+import threading
 import importlib.util
 from pathlib import Path
-from PyQt6.QtWidgets import QFormLayout, QSpinBox, QDoubleSpinBox, QCheckBox, QLineEdit, QLabel
 
-# UI Generation Mapping
+# UI Generation Mapping (PyQt6 widget class names; Qt is only imported to build forms,
+# so discovery also works headless)
 WIDGET_MAP = {
-    int: QSpinBox,
-    float: QDoubleSpinBox,
-    bool: QCheckBox,
-    str: QLineEdit
+    int: "QSpinBox",
+    float: "QDoubleSpinBox",
+    bool: "QCheckBox",
+    str: "QLineEdit"
 }
 
-def discover_plugins(directory="modules"):
-    """Scans /modules and imports scripts using importlib."""
+# Annotation names as they appear in source -> types above (lazy discovery)
+ANNOTATION_TYPES = {"int": int, "float": float, "bool": bool, "str": str}
+
+# run() parameters filled in by the application rather than the form
+RESERVED_KEYWORDS = ('data_path', 'progress_callback', 'cancel_token', 'metrics')
+
+METADATA_CACHE_NAME = ".plugin_cache.json"
+METADATA_CACHE_VERSION = 1
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return None
+
+def read_plugin_metadata(file_path):
+    """
+    Reads NAME, DESCRIPTION and the run() parameters of a plugin by static inspection,
+    without importing it. Returns None when the file defines no module-level run().
+    Each parameter is [name, annotation name, default, has_default].
+    """
+    tree = ast.parse(Path(file_path).read_text(encoding="utf-8"), filename=str(file_path))
+    meta = {"name": None, "description": None, "params": None}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in ("NAME", "DESCRIPTION"):
+                    meta[target.id.lower()] = _literal(node.value)
+        elif isinstance(node, ast.FunctionDef) and node.name == "run":
+            args = node.args.posonlyargs + node.args.args
+            defaults = [None] * (len(args) - len(node.args.defaults)) + node.args.defaults
+            pairs = list(zip(args, defaults)) + list(zip(node.args.kwonlyargs, node.args.kw_defaults))
+            meta["params"] = [[arg.arg,
+                               arg.annotation.id if isinstance(arg.annotation, ast.Name) else None,
+                               _literal(default) if default is not None else None,
+                               default is not None]
+                              for arg, default in pairs]
+    return meta if meta["params"] is not None else None
+
+class LazyPlugin:
+    """
+    Stand-in for a plugin module built from its static metadata. The module itself is
+    imported the first time run() is called, i.e. inside the worker thread.
+    """
+    def __init__(self, module_name, file_path, meta):
+        self.module_name = module_name
+        self.__file__ = str(file_path)
+        self.NAME = meta["name"] or module_name
+        self.DESCRIPTION = meta["description"] or ""
+        self.params = meta["params"]
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._module is None:
+                spec = importlib.util.spec_from_file_location(self.module_name, self.__file__)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                self._module = module
+        return self._module
+
+    def run(self, *args, **kwargs):
+        return self.load().run(*args, **kwargs)
+
+def _load_metadata_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("plugins", {}) if cache.get("version") == METADATA_CACHE_VERSION else {}
+
+def _save_metadata_cache(cache_path, entries):
+    try:
+        tmp = cache_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": METADATA_CACHE_VERSION, "plugins": entries}, f)
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass  # Read-only install: metadata is simply re-parsed next time
+
+def discover_plugins(directory="modules", lazy=True):
+    """
+    Scans /modules for scripts that define run(). By default plugins are discovered
+    lazily from their source (metadata cached by file mtime in .plugin_cache.json) and
+    only imported when executed; lazy=False imports every module up front.
+    Plugins that fail to parse or import are skipped.
+    """
     plugins = {}
     modules_path = Path(directory)
     
@@ -21,40 +111,78 @@ def discover_plugins(directory="modules"):
         os.makedirs(modules_path)
         return plugins
 
-    for file_path in modules_path.glob("*.py"):
+    cache_path = modules_path / METADATA_CACHE_NAME
+    cached = _load_metadata_cache(cache_path) if lazy else {}
+    entries = {}
+
+    for file_path in sorted(modules_path.glob("*.py")):
         if file_path.name == "__init__.py":
             continue
             
         module_name = file_path.stem
-        spec = importlib.util.spec_from_file_location(module_name, file_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        if lazy:
+            st = file_path.stat()
+            entry = cached.get(file_path.name)
+            if entry is None or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+                try:
+                    meta = read_plugin_metadata(file_path)
+                except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+                    print(f"Skipping plugin {file_path.name}: {e}")
+                    continue
+                entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "meta": meta}
+            entries[file_path.name] = entry
+            if entry["meta"] is not None:
+                plugins[module_name] = LazyPlugin(module_name, file_path, entry["meta"])
+            continue
+
+        try:
+            spec = importlib.util.spec_from_file_location(module_name, file_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception as e:
+            print(f"Skipping plugin {file_path.name}: {e}")
+            continue
         
         # Every analysis module must implement a run function
         if hasattr(module, "run"):
             plugins[module_name] = module
+
+    if lazy and entries != cached:
+        _save_metadata_cache(cache_path, entries)
             
     return plugins
 
+def plugin_parameters(module):
+    """
+    Returns [(name, annotation, default)] for a plugin's run(), from static metadata for
+    a LazyPlugin or by introspection for an imported module. Missing defaults are None.
+    """
+    if isinstance(module, LazyPlugin):
+        return [(name, ANNOTATION_TYPES.get(annotation), default if has_default else None)
+                for name, annotation, default, has_default in module.params]
+    sig = inspect.signature(module.run)
+    empty = inspect.Parameter.empty
+    return [(name, param.annotation if param.annotation is not empty else None,
+             param.default if param.default is not empty else None)
+            for name, param in sig.parameters.items()]
+
 def create_plugin_ui(module):
-    """Uses introspection to build controls based on the run function."""
+    """Builds controls based on the run function's parameters."""
+    from PyQt6.QtWidgets import QFormLayout, QSpinBox, QDoubleSpinBox, QCheckBox, QLineEdit, QLabel
+    import PyQt6.QtWidgets as QtWidgets
+
     layout = QFormLayout()
     widgets = {}
     
-    # Introspect the 'run' function signature
-    sig = inspect.signature(module.run)
-    
-    for name, param in sig.parameters.items():
+    # Parameters of the 'run' function (static metadata or introspection)
+    for name, arg_type, default_value in plugin_parameters(module):
         # Skip Reserved Keywords
-        if name in ['data_path', 'progress_callback']:
+        if name in RESERVED_KEYWORDS:
             continue
             
         # Mandatory Type Hinting for UI generation
-        arg_type = param.annotation
-        default_value = param.default if param.default is not inspect.Parameter.empty else None
-        
         # Translate Python types into PyQt6 widgets
-        widget_class = WIDGET_MAP.get(arg_type, QLineEdit)
+        widget_class = getattr(QtWidgets, WIDGET_MAP.get(arg_type, "QLineEdit"))
         widget = widget_class()
         
         # Initialize with Default Values
@@ -62,6 +190,9 @@ def create_plugin_ui(module):
             if isinstance(widget, QCheckBox):
                 widget.setChecked(default_value)
             elif isinstance(widget, (QSpinBox, QDoubleSpinBox)):
+                if isinstance(widget, QDoubleSpinBox):
+                    # The default of 2 decimals would round small values such as 0.001 to 0
+                    widget.setDecimals(6)
                 widget.setRange(0, 1000000) # Scientific range
                 widget.setValue(default_value)
             elif isinstance(widget, QLineEdit):
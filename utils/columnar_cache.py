@@ -0,0 +1,111 @@
+import os
+import hashlib
+import threading
+from pathlib import Path
+import pandas as pd
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("HCS_COLUMNAR_CACHE", Path.home() / ".cache" / "hcs_app" / "columnar"))
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+class ColumnarCache:
+    """
+    Drop-in replacement for pd.read_csv backed by Feather sidecars.
+
+    The first read of a CSV parses it as usual and stores an uncompressed Feather copy
+    keyed on the resolved path, size, mtime and the read options. Later reads
+    memory-map that copy and only materialize the requested columns. The cache is
+    bounded by max_bytes and evicts the least recently used sidecars first.
+    Requires pyarrow.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def sidecar_path(self, csv_path, **read_kwargs) -> Path:
+        st = os.stat(csv_path)
+        key = f"{os.path.realpath(csv_path)}|{st.st_size}|{st.st_mtime_ns}|{sorted(read_kwargs.items())!r}"
+        return self.cache_dir / (hashlib.sha1(key.encode()).hexdigest() + ".feather")
+
+    def read_csv(self, csv_path, usecols=None, **read_kwargs) -> pd.DataFrame:
+        """Like pd.read_csv(csv_path, usecols=usecols, **read_kwargs); usecols must be a list."""
+        import pyarrow.feather as feather
+
+        sidecar = self.sidecar_path(csv_path, **read_kwargs)
+        try:
+            table = feather.read_table(sidecar, columns=usecols, memory_map=True)
+        except (FileNotFoundError, OSError):
+            table = None
+        if table is not None:
+            os.utime(sidecar)  # LRU recency
+            with self.lock:
+                self.hits += 1
+            return table.to_pandas()
+
+        with self.lock:
+            self.misses += 1
+        df = pd.read_csv(csv_path, **read_kwargs)
+        self.store(sidecar, df)
+        return df[usecols] if usecols is not None else df
+
+    def prime(self, csv_path, df: pd.DataFrame, **read_kwargs):
+        """Registers df as the parsed content of a CSV that was just written from it."""
+        self.store(self.sidecar_path(csv_path, **read_kwargs), df)
+
+    def store(self, sidecar: Path, df: pd.DataFrame):
+        import pyarrow.feather as feather
+
+        tmp = sidecar.with_name(f"{sidecar.name}.{threading.get_ident()}.tmp")
+        try:
+            feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+            os.replace(tmp, sidecar)
+        except Exception:
+            # Frames Arrow cannot represent (e.g. mixed-type object columns) are simply not cached
+            tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used sidecars until the cache fits in max_bytes."""
+        with self.lock:
+            entries = []
+            for p in self.cache_dir.glob("*.feather"):
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                self.evictions += 1
+
+    def counters(self) -> tuple:
+        """(hits, misses, evictions) so far; pass to summary(since=...) to report one run."""
+        with self.lock:
+            return self.hits, self.misses, self.evictions
+
+    def summary(self, since=(0, 0, 0)) -> str:
+        hits, misses, evictions = (now - before for now, before in zip(self.counters(), since))
+        total = hits + misses
+        rate = (100.0 * hits / total) if total else 0.0
+        return f"Columnar cache: {hits} hits, {misses} misses ({rate:.0f}% hit rate), {evictions} evictions"
+
+_default_cache = None
+
+def default_cache() -> ColumnarCache:
+    """Process-wide cache shared by all plugins."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ColumnarCache()
+    return _default_cache
+
+def read_csv_cached(csv_path, usecols=None, **read_kwargs) -> pd.DataFrame:
+    return default_cache().read_csv(csv_path, usecols=usecols, **read_kwargs)
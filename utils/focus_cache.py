@@ -0,0 +1,71 @@
+import os
+import sqlite3
+from pathlib import Path
+
+class FocusScoreCache:
+    """
+    On-disk index of per-plane focus scores, keyed on (path, size, mtime, method).
+    A plane whose file changed since it was scored is a miss and its row is replaced
+    on the next store(). Only the owning thread may use an instance (sqlite3 default).
+    """
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "path TEXT NOT NULL, method TEXT NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, score REAL NOT NULL, PRIMARY KEY (path, method))"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _key(path):
+        st = os.stat(path)
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+    def lookup(self, paths, method):
+        """Returns cached scores aligned with paths, None where the plane must be scored."""
+        scores = []
+        for path in paths:
+            abs_path, size, mtime_ns = self._key(path)
+            row = self.conn.execute(
+                "SELECT score FROM scores WHERE path = ? AND method = ? AND size = ? AND mtime_ns = ?",
+                (abs_path, method, size, mtime_ns),
+            ).fetchone()
+            scores.append(None if row is None else row[0])
+        found = sum(s is not None for s in scores)
+        self.hits += found
+        self.misses += len(scores) - found
+        return scores
+
+    def store(self, paths, method, scores):
+        rows = [(*self._key(p), method, float(s)) for p, s in zip(paths, scores)]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO scores (path, size, mtime_ns, method, score) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.conn.commit()
+
+    def retain(self, paths):
+        """Evicts rows for planes that are no longer part of the plate."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (path TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM keep")
+        self.conn.executemany("INSERT OR IGNORE INTO keep VALUES (?)",
+                              ((os.path.abspath(p),) for p in paths))
+        evicted = self.conn.execute("DELETE FROM scores WHERE path NOT IN (SELECT path FROM keep)").rowcount
+        self.conn.commit()
+        return evicted
+
+    def clear(self):
+        self.conn.execute("DELETE FROM scores")
+        self.conn.commit()
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (100.0 * self.hits / total) if total else 0.0
+        return f"Focus cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
+    def close(self):
+        self.conn.close()
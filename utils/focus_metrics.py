@@ -0,0 +1,105 @@
+import numpy as np
+from skimage.util import img_as_float
+
+# Registry: names usable in zstack_filter's methods_mapping -> batched metric.
+# Every metric takes a (Z, Y, X) block and returns one score per plane.
+FOCUS_METRICS = {}
+
+def register_metric(*names):
+    def decorator(fn):
+        for name in names:
+            FOCUS_METRICS[name] = fn
+        return fn
+    return decorator
+
+def _shifted_diff(x, axis, step):
+    """x[i + step] - x[i] along axis, edge-replicated so the output keeps x's shape."""
+    out = np.zeros_like(x)
+    src = [slice(None)] * x.ndim
+    dst = [slice(None)] * x.ndim
+    src[axis], dst[axis] = slice(step, None), slice(None, -step)
+    out[tuple(dst)] = x[tuple(src)] - x[tuple(dst)]
+    return out
+
+@register_metric('laplacian')
+def laplacian_variance(stack):
+    """
+    Variance of the 4-neighbour Laplacian per plane. Matches np.var(filters.laplace(plane))
+    (img_as_float scaling, reflect boundary) up to float rounding.
+    """
+    if stack.dtype in (np.uint8, np.uint16):
+        # Integer Laplacians of <=16-bit data are exact in float32; apply the
+        # img_as_float scaling to the variance instead of to every pixel
+        x = stack.astype(np.float32)
+        scale = 1.0 / float(np.iinfo(stack.dtype).max) ** 2
+    else:
+        x, scale = img_as_float(stack), 1.0
+    p = np.pad(x, ((0, 0), (1, 1), (1, 1)), mode='edge')
+    # Sign is flipped relative to the kernel, which leaves the variance unchanged
+    lap = p[:, :-2, 1:-1] + p[:, 2:, 1:-1]
+    lap += p[:, 1:-1, :-2]
+    lap += p[:, 1:-1, 2:]
+    lap -= 4 * x
+    return lap.var(axis=(1, 2), dtype=np.float64) * scale
+
+@register_metric('variance', 'normalized_variance')
+def normalized_variance(stack):
+    """Intensity variance divided by mean intensity per plane (0 for empty planes)."""
+    scores = []
+    for plane in stack:
+        mean = np.mean(plane)
+        scores.append(np.var(plane) / mean if mean != 0 else 0)
+    return np.array(scores, dtype=float)
+
+@register_metric('tenengrad')
+def tenengrad(stack):
+    """Mean squared Sobel gradient magnitude per plane."""
+    x = np.pad(stack.astype(np.float32), ((0, 0), (1, 1), (1, 1)), mode='edge')
+    # Separable Sobel: derivative along one axis, [1, 2, 1] smoothing along the other
+    gx = x[:, :, 2:] - x[:, :, :-2]
+    gx = gx[:, :-2, :] + 2 * gx[:, 1:-1, :] + gx[:, 2:, :]
+    gy = x[:, 2:, :] - x[:, :-2, :]
+    gy = gy[:, :, :-2] + 2 * gy[:, :, 1:-1] + gy[:, :, 2:]
+    return (gx * gx + gy * gy).mean(axis=(1, 2), dtype=np.float64)
+
+@register_metric('brenner')
+def brenner(stack):
+    """Brenner gradient: mean squared difference between pixels two columns apart."""
+    d = _shifted_diff(stack.astype(np.float32), axis=2, step=2)
+    return (d * d).mean(axis=(1, 2), dtype=np.float64)
+
+def reduce_for_scoring(stack, factor=1, mode="downsample"):
+    """
+    Shrinks a (Z, Y, X) block before scoring. 'downsample' bins factor x factor pixels,
+    'crop' keeps the central 1/factor of each axis. Factor 1 returns the block unchanged.
+    The factor is capped at the block's smaller side, so small blocks (e.g. edge tiles)
+    never shrink to nothing.
+    """
+    z, h, w = stack.shape
+    factor = min(factor, h, w)
+    if factor <= 1:
+        return stack
+    if mode == "crop":
+        ch, cw = min(max(h // factor, 3), h), min(max(w // factor, 3), w)
+        y0, x0 = (h - ch) // 2, (w - cw) // 2
+        return stack[:, y0:y0 + ch, x0:x0 + cw]
+    h, w = (h // factor) * factor, (w // factor) * factor
+    binned = np.zeros((z, h // factor, w // factor), dtype=np.float32)
+    for dy in range(factor):
+        for dx in range(factor):
+            binned += stack[:, dy:h:factor, dx:w:factor]
+    return binned / (factor * factor)
+
+def metric_key(method, factor=1, mode="downsample"):
+    """Identifies a scoring configuration, e.g. for the focus score cache."""
+    return method if factor <= 1 else f"{method}@{mode}{factor}"
+
+def score_stack(stack, method, factor=1, mode="downsample", batch_size=8):
+    """
+    Scores every plane of a (Z, Y, X) block with a registered metric, in batches of
+    batch_size planes to bound the float temporaries.
+    """
+    metric = FOCUS_METRICS[method]
+    scores = [metric(reduce_for_scoring(stack[i:i + batch_size], factor, mode))
+              for i in range(0, len(stack), batch_size)]
+    return np.concatenate(scores) if scores else np.empty(0)
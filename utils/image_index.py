@@ -0,0 +1,118 @@
+import os
+import re
+import json
+import concurrent.futures
+from pathlib import Path
+
+IMAGE_PATTERN = re.compile(r'W(\d+)F(\d+)T(\d+)Z(\d+)C(\d+)\.tif')
+
+class ImageIndex:
+    """
+    Manifest of (well, field, timepoint, z, channel) -> path for one plate.
+
+    Directories are listed in parallel with os.scandir. The manifest remembers each
+    directory's mtime, so a refresh only re-lists directories whose entries were added,
+    removed or renamed. Files rewritten in place do not change their directory's mtime;
+    refresh(verify_files=True) re-stats the cached files of unchanged directories so
+    their size/mtime stay current as well.
+    """
+    VERSION = 1
+
+    def __init__(self, root, manifest_path, exclude=(), num_workers=16):
+        self.root = Path(root)
+        self.manifest_path = Path(manifest_path)
+        self.exclude = {os.path.abspath(p) for p in exclude}
+        self.num_workers = num_workers
+        self.dirs = {}
+        self.rescanned = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("version") == self.VERSION and manifest.get("root") == os.path.abspath(self.root):
+            self.dirs = manifest["dirs"]
+
+    def save(self):
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": self.VERSION, "root": os.path.abspath(self.root), "dirs": self.dirs}, f)
+        os.replace(tmp, self.manifest_path)
+
+    def _restat(self, full, cached):
+        """Cached listing with fresh file sizes/mtimes, or None if a cached file is gone."""
+        files = []
+        for name, *fields, size, mtime_ns in cached["files"]:
+            try:
+                st = os.stat(full / name)
+            except FileNotFoundError:
+                return None
+            files.append([name, *fields, st.st_size, st.st_mtime_ns])
+        return dict(cached, files=files)
+
+    def _scan_dir(self, rel, cached, verify_files=False):
+        full = self.root / rel
+        try:
+            mtime_ns = os.stat(full).st_mtime_ns
+        except FileNotFoundError:
+            return rel, None, False
+        if cached is not None and cached["mtime_ns"] == mtime_ns:
+            listing = self._restat(full, cached) if verify_files else cached
+            if listing is not None:
+                return rel, listing, False
+
+        subdirs, files = [], []
+        with os.scandir(full) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) not in self.exclude:
+                        subdirs.append(entry.name)
+                    continue
+                m = IMAGE_PATTERN.match(entry.name)
+                if m and entry.name.endswith('.tif'):
+                    st = entry.stat()
+                    files.append([entry.name, *map(int, m.groups()), st.st_size, st.st_mtime_ns])
+        return rel, {"mtime_ns": mtime_ns, "subdirs": subdirs, "files": files}, True
+
+    def refresh(self, verify_files=False):
+        """
+        Walks the plate, re-listing only changed directories. With verify_files, the files
+        of unchanged directories are re-stated too (one stat per file). Returns self.
+        """
+        old_dirs, new_dirs = self.dirs, {}
+        self.rescanned = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            pending = {pool.submit(self._scan_dir, ".", old_dirs.get("."), verify_files)}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    rel, listing, rescanned = future.result()
+                    if listing is None:
+                        continue
+                    new_dirs[rel] = listing
+                    self.rescanned += rescanned
+                    for sub in listing["subdirs"]:
+                        sub_rel = os.path.normpath(os.path.join(rel, sub))
+                        # Cached listings may predate a directory joining the exclusions
+                        if os.path.abspath(self.root / sub_rel) in self.exclude:
+                            continue
+                        pending.add(pool.submit(self._scan_dir, sub_rel, old_dirs.get(sub_rel), verify_files))
+        self.dirs = new_dirs
+        return self
+
+    def records(self):
+        """Yields (well, field, timepoint, z, channel, path, size, mtime_ns) for every image."""
+        for rel, listing in self.dirs.items():
+            base = self.root / rel
+            for name, w, f, t, z, c, size, mtime_ns in listing["files"]:
+                yield w, f, t, z, c, base / name, size, mtime_ns
+
+    def signatures(self, key):
+        """Groups files by key(record) into frozensets of (path, size, mtime_ns) for change detection."""
+        groups = {}
+        for rec in self.records():
+            groups.setdefault(key(rec), set()).add((str(rec[5]), rec[6], rec[7]))
+        return {k: frozenset(v) for k, v in groups.items()}
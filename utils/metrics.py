@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_METRICS_DIR = Path(os.environ.get("HCS_METRICS_DIR", Path.home() / ".cache" / "hcs_app" / "metrics"))
+RSS_SAMPLE_INTERVAL = 0.05
+
+def peak_rss_mb():
+    """High-water resident memory of this process and its (finished) worker processes."""
+    if resource is None:
+        return 0.0
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+
+def current_rss_mb():
+    """Resident memory of this process right now; None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+class StageHandle:
+    """Yielded by StageMetrics.stage(); the body reports the I/O it did through it."""
+    def __init__(self):
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_mb = 0.0
+        self.overlapped = False
+
+    def sample_rss(self, rss):
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+
+    def read(self, nbytes):
+        self.bytes_read += nbytes
+
+    def wrote(self, nbytes):
+        self.bytes_written += nbytes
+
+class StageMetrics:
+    """
+    Per-stage timings for one plugin run, passed to plugins as the reserved 'metrics'
+    keyword. Each named stage accumulates calls, wall time, CPU time, bytes read/written as
+    reported by the plugin, and the peak RSS of this process while the stage ran (sampled
+    every RSS_SAMPLE_INTERVAL seconds; the process-lifetime peak where /proc is missing).
+
+    CPU time is that of the whole process, so it includes the stage's thread pools, as
+    long as no other stage runs at the same time. Stages that overlap (entered from
+    several threads at once, or nested) count only the CPU time of their own thread,
+    and their wall times add up. Worker processes are never included.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.active = set()
+        self.sampler = None
+
+    def _sample(self):
+        """Sampler thread: feeds the current RSS to every active stage until none is left."""
+        while True:
+            rss = current_rss_mb()
+            with self.lock:
+                if not self.active:
+                    self.sampler = None
+                    return
+                for handle in self.active:
+                    handle.sample_rss(rss)
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+    def _enter(self, handle):
+        rss = current_rss_mb()
+        with self.lock:
+            if self.active:
+                handle.overlapped = True
+                for other in self.active:
+                    other.overlapped = True
+            self.active.add(handle)
+            if rss is None:
+                return
+            handle.sample_rss(rss)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, name="StageMetricsRSS", daemon=True)
+                self.sampler.start()
+
+    @contextmanager
+    def stage(self, name):
+        handle = StageHandle()
+        self._enter(handle)
+        wall, cpu, thread_cpu = time.perf_counter(), time.process_time(), time.thread_time()
+        try:
+            yield handle
+        finally:
+            wall = time.perf_counter() - wall
+            cpu, thread_cpu = time.process_time() - cpu, time.thread_time() - thread_cpu
+            rss = current_rss_mb()
+            handle.sample_rss(rss if rss is not None else peak_rss_mb())
+            with self.lock:
+                self.active.discard(handle)
+                cpu = thread_cpu if handle.overlapped else cpu
+                rss = handle.peak_rss_mb
+                s = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "bytes_read": 0,
+                                                  "bytes_written": 0, "peak_rss_mb": 0.0})
+                s["calls"] += 1
+                s["wall_s"] += wall
+                s["cpu_s"] += cpu
+                s["bytes_read"] += handle.bytes_read
+                s["bytes_written"] += handle.bytes_written
+                s["peak_rss_mb"] = max(s["peak_rss_mb"], rss)
+
+    def timed(self, name):
+        """Decorator form of stage() for functions without I/O accounting."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def records(self):
+        """One dict per stage, in the order the stages were first entered."""
+        with self.lock:
+            return [dict(stage=name, **values) for name, values in self.stages.items()]
+
+    def summary_table(self):
+        rows = [f"{'stage':<26}{'calls':>6}{'wall s':>9}{'cpu s':>9}{'read MB':>9}{'written MB':>11}{'peak MB':>9}"]
+        for r in self.records():
+            rows.append(f"{r['stage']:<26}{r['calls']:>6}{r['wall_s']:>9.2f}{r['cpu_s']:>9.2f}"
+                        f"{r['bytes_read'] / 1e6:>9.1f}{r['bytes_written'] / 1e6:>11.1f}{r['peak_rss_mb']:>9.0f}")
+        return "\n".join(rows)
+
+    def write_jsonl(self, run_name, metrics_dir=DEFAULT_METRICS_DIR, **run_info):
+        """Writes one JSON line per stage to <metrics_dir>/<timestamp>_<run_name>.jsonl; returns the path."""
+        metrics_dir = Path(metrics_dir)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started)) + f"{self.started % 1:.3f}"[1:]
+        safe_name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in run_name)
+        path = metrics_dir / f"{stamp}_{safe_name}.jsonl"
+        run = dict(run=run_name, started=self.started, finished=time.time(), **run_info)
+        with open(path, "w") as f:
+            for record in self.records():
+                f.write(json.dumps(dict(run, **record)) + "\n")
+        return path
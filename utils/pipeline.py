@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import hashlib
+import traceback
+import concurrent.futures
+from pathlib import Path
+
+from plugin_manager import plugin_parameters
+from utils.metrics import StageMetrics
+from utils.progress import AnalysisCancelled, raise_if_cancelled
+
+DEFAULT_STATE_PATH = Path.home() / ".cache" / "hcs_app" / "pipeline_state.json"
+
+class PipelineStep:
+    """
+    One plugin run in a pipeline: plugin.run(data_path=data_path, **params) once every
+    step in depends_on has completed. cpu and memory_gb are what the step claims from
+    the pipeline's budget while it runs (cpu defaults to its num_workers parameter).
+    """
+    def __init__(self, step_id, plugin, data_path, params=None, depends_on=(), cpu=None, memory_gb=0.0):
+        self.step_id = step_id
+        self.plugin = plugin
+        self.data_path = str(data_path)
+        self.params = dict(params or {})
+        self.depends_on = list(depends_on)
+        self.cpu = max(int(cpu if cpu is not None else self.params.get("num_workers", 1)), 1)
+        self.memory_gb = memory_gb
+        self.progress = 0
+
+    def signature(self):
+        """Identifies the step's configuration; a completed step is only reused while it matches."""
+        config = {"plugin": getattr(self.plugin, "__file__", repr(self.plugin)), "data_path": self.data_path,
+                  "params": {k: repr(v) for k, v in sorted(self.params.items())}}
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+class _StepProgress:
+    """progress_callback handed to a step; folds its updates into the pipeline's overall progress."""
+    def __init__(self, pipeline, step):
+        self.pipeline, self.step = pipeline, step
+
+    def emit(self, value):
+        self.step.progress = value
+        self.pipeline._report_progress()
+
+class Pipeline:
+    """
+    Dependency graph of plugin steps (e.g. MIP -> aggregation -> normalization for each
+    plate), run on threads in this process.
+
+    Steps whose dependencies are done start as soon as they fit in the CPU and memory
+    budget, so independent plates run concurrently; a step larger than the whole budget
+    runs alone. Completed steps are recorded in a JSON state file after each step, so a
+    rerun after a crash, failure or cancellation resumes after the last completed step.
+    The record only serves that resume: once every step has completed it is dropped, so
+    running the same pipeline again (e.g. after new images were acquired) redoes all
+    steps. reset() drops it by hand. Steps that depend on a failed step are skipped.
+    """
+    def __init__(self, state_path=DEFAULT_STATE_PATH, cpu_budget=None, memory_budget_gb=None):
+        self.state_path = Path(state_path)
+        self.cpu_budget = cpu_budget or os.cpu_count() or 1
+        self.memory_budget_gb = memory_budget_gb
+        self.steps = {}
+        self.status = {}
+        self.messages = {}
+        self.progress_callback = None
+        self.status_callback = None
+
+    def add_step(self, step_id, plugin, data_path, params=None, depends_on=(), cpu=None, memory_gb=0.0):
+        if step_id in self.steps:
+            raise ValueError(f"Duplicate pipeline step '{step_id}'")
+        unknown = [dep for dep in depends_on if dep not in self.steps]
+        if unknown:
+            raise ValueError(f"Step '{step_id}' depends on unknown step(s): {', '.join(unknown)}")
+        self.steps[step_id] = PipelineStep(step_id, plugin, data_path, params, depends_on, cpu, memory_gb)
+        return self.steps[step_id]
+
+    def load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, self.state_path)
+
+    def reset(self):
+        """Forgets this pipeline's completed steps, so the next run starts from the first step."""
+        state = self.load_state()
+        forgotten = [state.pop(step_id) for step_id in self.steps if step_id in state]
+        if not forgotten:
+            return
+        if state:
+            self.save_state(state)
+        else:
+            self.state_path.unlink(missing_ok=True)
+
+    def _report_progress(self):
+        if self.progress_callback and self.steps:
+            self.progress_callback.emit(int(sum(s.progress for s in self.steps.values()) / len(self.steps)))
+
+    def _set_status(self, step, status, message=""):
+        self.status[step.step_id] = status
+        self.messages[step.step_id] = message
+        if status in ("done", "reused"):
+            step.progress = 100
+        if self.status_callback:
+            self.status_callback(step.step_id, status, message)
+
+    def _execute(self, step, cancel_token):
+        accepted = {name for name, _, _ in plugin_parameters(step.plugin)}
+        kwargs = dict(step.params)
+        if "progress_callback" in accepted:
+            kwargs["progress_callback"] = _StepProgress(self, step)
+        if "cancel_token" in accepted:
+            kwargs["cancel_token"] = cancel_token
+        if "metrics" not in accepted:
+            return step.plugin.run(data_path=step.data_path, **kwargs)
+        kwargs["metrics"] = metrics = StageMetrics()
+        status = "error"
+        try:
+            result = step.plugin.run(data_path=step.data_path, **kwargs)
+            status = "finished"
+            return result
+        finally:
+            metrics.write_jsonl(step.step_id, status=status, data_path=step.data_path)
+
+    def run(self, progress_callback=None, cancel_token=None):
+        """Runs every step not completed by an interrupted earlier run. Returns a per-step summary."""
+        self.progress_callback = progress_callback
+        state = self.load_state()
+        cpu_free = self.cpu_budget
+        mem_free = self.memory_budget_gb
+        pending = list(self.steps.values())
+        running = {}
+
+        for step in pending[:]:
+            done = state.get(step.step_id)
+            if done and done["signature"] == step.signature():
+                self._set_status(step, "reused", done["message"])
+                pending.remove(step)
+        self._report_progress()
+
+        def fits(step):
+            if not running:
+                return True
+            mem_ok = mem_free is None or step.memory_gb <= mem_free
+            return step.cpu <= cpu_free and mem_ok
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(pending), 1)) as pool:
+            while pending or running:
+                cancelled = cancel_token is not None and cancel_token.cancelled
+                for step in pending[:]:
+                    deps = [self.status.get(dep) for dep in step.depends_on]
+                    if any(d in ("failed", "skipped", "cancelled") for d in deps) or (cancelled and not running):
+                        pending.remove(step)
+                        self._set_status(step, "cancelled" if cancelled else "skipped")
+                    elif not cancelled and all(d in ("done", "reused") for d in deps) and fits(step):
+                        pending.remove(step)
+                        running[pool.submit(self._execute, step, cancel_token)] = step
+                        cpu_free -= step.cpu
+                        if mem_free is not None:
+                            mem_free -= step.memory_gb
+                        self._set_status(step, "running")
+                if not running:
+                    continue
+
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    cpu_free += step.cpu
+                    if mem_free is not None:
+                        mem_free += step.memory_gb
+                    try:
+                        message = future.result()
+                    except AnalysisCancelled:
+                        self._set_status(step, "cancelled")
+                        continue
+                    except Exception as e:
+                        traceback.print_exc()
+                        self._set_status(step, "failed", f"{type(e).__name__}: {e}")
+                        continue
+                    message = "" if message is None else str(message)
+                    if message.startswith("Error:"):
+                        # Plugins report bad configuration as an "Error: ..." result
+                        self._set_status(step, "failed", message)
+                        continue
+                    self._set_status(step, "done", message)
+                    state[step.step_id] = {"signature": step.signature(), "message": message,
+                                           "finished": time.time()}
+                    self.save_state(state)
+                self._report_progress()
+
+        if all(self.status.get(step_id) in ("done", "reused") for step_id in self.steps):
+            self.reset()
+        raise_if_cancelled(cancel_token)
+        return self.summary()
+
+    def summary(self):
+        lines = []
+        for step_id in self.steps:
+            message = self.messages.get(step_id, "").strip().splitlines()
+            lines.append(f"{step_id}: {self.status.get(step_id, 'pending')}" + (f" - {message[0]}" if message else ""))
+        return "\n".join(lines)
+
+def plate_chain(pipeline, plate_dir, plugins, column_dtypes_path="CSVs/column_dtypes.csv",
+                output_directory="Analysis_Results", num_workers=4):
+    """
+    Adds the standard per-plate chain to pipeline: Smart MIP Filter -> HCS Master Aggregator
+    -> Well-Level Normalization. plugins maps module names (as in plugin_manager.discover_plugins)
+    to plugins. The aggregated single-cell table is written as <plate>_joined.csv so the
+    normalization step picks it up, and it is handed over through the columnar cache
+    instead of being parsed again. Returns the id of the last step.
+    """
+    plate = Path(plate_dir)
+    mip = pipeline.add_step(f"{plate.name}:mip", plugins["zstack_filter"], plate,
+                            {"num_workers": num_workers})
+    merge = pipeline.add_step(f"{plate.name}:aggregate", plugins["cp_merger_module"], plate,
+                              {"output_directory": output_directory, "num_workers": num_workers,
+                               "final_single_cell_name": f"{plate.name}_joined.csv",
+                               "use_columnar_cache": True},
+                              depends_on=[mip.step_id])
+    norm = pipeline.add_step(f"{plate.name}:normalize", plugins["normalization_plugin"], plate / output_directory,
+                             {"column_dtypes_path": str(column_dtypes_path), "use_columnar_cache": True},
+                             depends_on=[merge.step_id], cpu=1)
+    return norm.step_id
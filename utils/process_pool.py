@@ -0,0 +1,67 @@
+import importlib.util
+import concurrent.futures
+from multiprocessing import shared_memory
+from pathlib import Path
+import numpy as np
+
+# Plugins are loaded by file path (see plugin_manager), so their functions cannot be
+# pickled by reference. Each worker process re-loads the plugin once in the pool
+# initializer and tasks only carry the name of the function to call.
+_plugin_module = None
+
+def _load_plugin(module_file):
+    global _plugin_module
+    module_file = Path(module_file)
+    spec = importlib.util.spec_from_file_location(module_file.stem, module_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _plugin_module = module
+
+def _call_plugin(func_name, args):
+    return getattr(_plugin_module, func_name)(*args)
+
+class PluginProcessPool(concurrent.futures.ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor whose workers run functions defined inside a plugin file.
+    Use it for plugin work that holds the GIL (TIFF decoding, skimage filters, numpy reductions).
+    """
+    def __init__(self, module_file, max_workers=None):
+        super().__init__(max_workers=max_workers, initializer=_load_plugin,
+                         initargs=(str(module_file),))
+
+    def submit_plugin(self, func_name, *args):
+        return self.submit(_call_plugin, func_name, args)
+
+class SharedArray:
+    """
+    Fixed-size array backed by a named shared memory block, owned by the creating process.
+    Only the small handle (name, shape, dtype) is sent to workers, never the pixels.
+    """
+    def __init__(self, shape, dtype):
+        self.shape, self.dtype = tuple(shape), np.dtype(dtype)
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        self.handle = (self.shm.name, self.shape, self.dtype.str)
+
+    @property
+    def array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def write_shared_array(handle, arr):
+    """
+    Worker side: copies arr into the block named by handle.
+    Returns False when arr does not match the block's shape/dtype, so the caller can fall back.
+    """
+    name, shape, dtype = handle
+    if arr.shape != tuple(shape) or arr.dtype != np.dtype(dtype):
+        return False
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)[...] = arr
+    finally:
+        shm.close()
+    return True
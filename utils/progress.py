@@ -0,0 +1,72 @@
+import time
+import threading
+from contextlib import contextmanager
+
+class AnalysisCancelled(Exception):
+    """Raised inside a plugin when its run was cancelled by the user."""
+
+class CancellationToken:
+    """
+    Thread-safe cancel flag shared between the GUI and a running plugin. Plugins call
+    raise_if_cancelled(token) at safe points (between wells, stacks, files).
+    """
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+def raise_if_cancelled(token):
+    """Raises AnalysisCancelled if token (may be None) has been cancelled."""
+    if token is not None and token.cancelled:
+        raise AnalysisCancelled("Analysis cancelled")
+
+@contextmanager
+def cancel_pending_on_error(*executors):
+    """
+    Cancels queued executor work when the body raises (including cancellation), so the
+    executor's own shutdown only waits for the tasks that are already running.
+    """
+    try:
+        yield
+    except BaseException:
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+class ThrottledProgress:
+    """
+    Wraps a progress emitter (anything with emit(int)) and forwards at most one update
+    per min_interval seconds. Repeated values are dropped; 100 is always forwarded.
+    flush() forwards the last value that was held back.
+    """
+    def __init__(self, emitter, min_interval=0.1):
+        self.emitter = emitter
+        self.min_interval = min_interval
+        self._last_value = None
+        self._last_time = 0.0
+        self._held = None
+        self._lock = threading.Lock()
+
+    def emit(self, value):
+        with self._lock:
+            if value == self._last_value:
+                return
+            now = time.monotonic()
+            if value < 100 and now - self._last_time < self.min_interval:
+                self._held = value
+                return
+            self._last_value, self._last_time, self._held = value, now, None
+        self.emitter.emit(value)
+
+    def flush(self):
+        with self._lock:
+            value, self._held = self._held, None
+            if value is None:
+                return
+            self._last_value, self._last_time = value, time.monotonic()
+        self.emitter.emit(value)
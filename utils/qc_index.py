@@ -0,0 +1,256 @@
+import os
+import numpy as np
+import pandas as pd
+
+from utils.streaming_stats import ColumnQuantileSketch
+
+QC_INDEX_VERSION = 1
+QUANTILE_LEVELS = ("none", "well", "image")
+
+def feature_columns(df):
+    """Numeric measurement columns of a merged single-cell frame (keys and metadata excluded)."""
+    return [c for c in df.columns
+            if not c.startswith("Metadata_") and c not in ("ImageNumber", "ObjectNumber")
+            and pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+
+def _sketch(X, error):
+    sketch = ColumnQuantileSketch(X.shape[1], error=error)
+    sketch.update(X)
+    return sketch.weighted()
+
+def _feature_block(df, columns):
+    """One block of feature columns as an array; float32 stays float32, anything else becomes float64."""
+    block = df[columns]
+    dtype = np.float32 if len(columns) and (block.dtypes == np.float32).all() else np.float64
+    return block.to_numpy(dtype=dtype)
+
+def summarize_well(df, well_id, quantiles="none", sketch_error=0.01, block_values=1 << 22):
+    """
+    Per-image count/sum/sumsq/min/max of every feature of one well's merged cells
+    (NaNs ignored), plus quantile sketches per well or per image on request.
+    Features are reduced about block_values values at a time in their stored dtype
+    (sums accumulate in float64), so memory stays near one column block, not the well.
+    Returns a dict of arrays that save_summary / build_qc_index understand.
+    """
+    features = feature_columns(df)
+    images = df["ImageNumber"].to_numpy() if "ImageNumber" in df.columns else np.zeros(len(df), dtype=np.int64)
+    order = None
+    if len(images) and np.any(images[1:] < images[:-1]):
+        order = np.argsort(images, kind="stable")
+        images = images[order]
+    starts = np.flatnonzero(np.r_[True, images[1:] != images[:-1]]) if len(images) else np.empty(0, dtype=np.intp)
+    ends = np.r_[starts[1:], len(images)]
+
+    summary = {"well": np.array(well_id), "quantiles": np.array(quantiles), "features": np.array(features, dtype=str),
+               "image_numbers": images[starts], "rows": np.diff(np.r_[starts, len(images)])}
+    stats = {key: [] for key in ("count", "sum", "sumsq", "min", "max")}
+    sketches = []
+    width = max(1, block_values // max(len(df), 1))
+    # At least one (possibly empty) block, so sketches keep their shape without features
+    for c in range(0, max(len(features), 1), width):
+        X = _feature_block(df, features[c:c + width])
+        if order is not None:
+            X = X[order]
+        if len(starts):
+            valid = ~np.isnan(X)
+            stats["count"].append(np.add.reduceat(valid, starts, axis=0, dtype=np.int64))
+            X0 = np.where(valid, X, 0)
+            del valid
+            stats["sum"].append(np.add.reduceat(X0, starts, axis=0, dtype=np.float64))
+            X0 = X0.astype(np.float64, copy=False)
+            X0 *= X0
+            stats["sumsq"].append(np.add.reduceat(X0, starts, axis=0))
+            del X0
+            # fmin/fmax skip NaNs; all-NaN columns stay NaN
+            stats["min"].append(np.fmin.reduceat(X, starts, axis=0).astype(np.float64))
+            stats["max"].append(np.fmax.reduceat(X, starts, axis=0).astype(np.float64))
+        # Sketch compaction depends only on row counts and the seed, so sketches of the
+        # same rows keep identical weights across column blocks and can be joined column-wise
+        if quantiles == "well":
+            sketches.append([_sketch(X, sketch_error)])
+        elif quantiles == "image":
+            sketches.append([_sketch(X[a:b], sketch_error) for a, b in zip(starts, ends)])
+    for key, parts in stats.items():
+        summary[key] = np.concatenate(parts, axis=1) if parts else np.zeros((0, len(features)))
+
+    # One (values, weights) per well or image, joined across column blocks
+    parts = [(np.concatenate([v for v, _ in block], axis=1), block[0][1]) for block in zip(*sketches)]
+    if quantiles == "well":
+        summary["well_sketch_values"], summary["well_sketch_weights"] = parts[0]
+    elif quantiles == "image":
+        summary["image_sketch_values"] = (np.concatenate([v for v, _ in parts]) if parts
+                                          else np.empty((0, len(features))))
+        summary["image_sketch_weights"] = np.concatenate([w for _, w in parts]) if parts else np.empty(0)
+        summary["image_sketch_offsets"] = np.r_[0, np.cumsum([len(w) for _, w in parts])].astype(np.int64)
+    return summary
+
+def save_summary(path, summary):
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, **summary)
+    os.replace(tmp, path)
+
+def load_summary(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def _scatter(values, columns, n_features, fill):
+    out = np.full((len(values), n_features), fill, dtype=np.float64)
+    out[:, columns] = values
+    return out
+
+def build_qc_index(summaries, path):
+    """
+    Combines per-well summaries (in plate order) into one .npz index covering the union of
+    their features. Writes it atomically to path and returns the path.
+    """
+    summaries = list(summaries)
+    features = list(dict.fromkeys(f for s in summaries for f in s["features"].tolist()))
+    position = {f: i for i, f in enumerate(features)}
+    n = len(features)
+
+    index = {"version": np.array(QC_INDEX_VERSION), "features": np.array(features, dtype=str),
+             "wells": np.array([str(s["well"]) for s in summaries], dtype=str)}
+    image_well, image_numbers, rows, stats = [], [], [], {k: [] for k in ("count", "sum", "sumsq", "min", "max")}
+    sketches = {"well": ([], [], [0]), "image": ([], [], [0])}
+    for w, s in enumerate(summaries):
+        columns = [position[f] for f in s["features"].tolist()]
+        image_well.append(np.full(len(s["image_numbers"]), w))
+        image_numbers.append(s["image_numbers"])
+        rows.append(s["rows"])
+        for key in stats:
+            fill = np.nan if key in ("min", "max") else 0.0
+            stats[key].append(_scatter(s[key], columns, n, fill))
+        for level in sketches:
+            values, weights, offsets = sketches[level]
+            if f"{level}_sketch_values" not in s:
+                if level == "well":
+                    offsets.append(offsets[-1])
+                continue
+            values.append(_scatter(s[f"{level}_sketch_values"], columns, n, np.nan))
+            weights.append(s[f"{level}_sketch_weights"])
+            if level == "well":
+                offsets.append(offsets[-1] + len(s["well_sketch_weights"]))
+            else:
+                offsets.extend(offsets[-1] + s["image_sketch_offsets"][1:])
+
+    concat = lambda parts, shape: np.concatenate(parts) if parts else np.empty(shape)
+    index["image_well"] = concat(image_well, (0,)).astype(np.int64)
+    index["image_numbers"] = concat(image_numbers, (0,)).astype(np.int64)
+    index["rows"] = concat(rows, (0,)).astype(np.int64)
+    for key, parts in stats.items():
+        index[f"image_{key}"] = concat(parts, (0, n))
+    for level, (values, weights, offsets) in sketches.items():
+        if values:
+            index[f"{level}_sketch_values"] = np.concatenate(values)
+            index[f"{level}_sketch_weights"] = np.concatenate(weights)
+            index[f"{level}_sketch_offsets"] = np.array(offsets, dtype=np.int64)
+
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, **index)
+    os.replace(tmp, path)
+    return path
+
+class QCIndex:
+    """
+    Read side of the per-well / per-image QC summary written by the HCS Master Aggregator.
+    Answers counts, means, standard deviations, extrema and (if sketches were kept)
+    approximate quantiles per image, per well or for the whole plate without touching the
+    single-cell table.
+
+        qc = QCIndex("Analysis_Results/master_single_cell_qc.npz")
+        qc.cell_counts()
+        qc.well_summary(["Cell_AreaShape_Area"], stats=("mean", "std"))
+        qc.quantile(0.5, level="well")
+    """
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.data = {key: data[key] for key in data.files}
+        self.features = self.data["features"].tolist()
+        self.wells = self.data["wells"].tolist()
+        self._position = {f: i for i, f in enumerate(self.features)}
+
+    def _columns(self, features):
+        features = self.features if features is None else [features] if isinstance(features, str) else list(features)
+        return features, [self._position[f] for f in features]
+
+    @staticmethod
+    def _derive(count, total, sumsq, low, high, stats, features):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            # Population variance from the running sums, clipped against rounding
+            var = np.maximum(sumsq / count - mean * mean, 0.0)
+        values = {"count": count, "sum": total, "mean": mean, "std": np.sqrt(var), "min": low, "max": high}
+        return pd.concat({stat: pd.DataFrame(values[stat], columns=features) for stat in stats}, axis=1)
+
+    def _by_well(self, key, reduce):
+        groups = self.data["image_well"]
+        out = np.full((len(self.wells), len(self.features)), np.nan if key in ("min", "max") else 0.0)
+        if len(groups):
+            reduce.at(out, groups, self.data[f"image_{key}"])
+        return out
+
+    def cell_counts(self):
+        """Single-cell rows per well."""
+        counts = np.bincount(self.data["image_well"], weights=self.data["rows"], minlength=len(self.wells))
+        return pd.Series(counts.astype(np.int64), index=pd.Index(self.wells, name="Metadata_WellID"), name="cells")
+
+    def image_summary(self, features=None, stats=("count", "mean", "std", "min", "max")):
+        """One row per (well, ImageNumber); columns are (stat, feature)."""
+        features, cols = self._columns(features)
+        d = self.data
+        table = self._derive(d["image_count"][:, cols], d["image_sum"][:, cols], d["image_sumsq"][:, cols],
+                             d["image_min"][:, cols], d["image_max"][:, cols], stats, features)
+        table.index = pd.MultiIndex.from_arrays([np.array(self.wells)[d["image_well"]], d["image_numbers"]],
+                                                names=["Metadata_WellID", "ImageNumber"])
+        return table
+
+    def well_summary(self, features=None, stats=("count", "mean", "std", "min", "max")):
+        """One row per well; columns are (stat, feature)."""
+        features, cols = self._columns(features)
+        count, total, sumsq = (self._by_well(k, np.add)[:, cols] for k in ("count", "sum", "sumsq"))
+        low, high = self._by_well("min", np.fmin)[:, cols], self._by_well("max", np.fmax)[:, cols]
+        table = self._derive(count, total, sumsq, low, high, stats, features)
+        table.index = pd.Index(self.wells, name="Metadata_WellID")
+        return table
+
+    def plate_summary(self, features=None, stats=("count", "mean", "std", "min", "max")):
+        """One row per feature for the whole plate; columns are the stats."""
+        features, cols = self._columns(features)
+        d = self.data
+        table = self._derive(d["image_count"][:, cols].sum(axis=0, keepdims=True),
+                             d["image_sum"][:, cols].sum(axis=0, keepdims=True),
+                             d["image_sumsq"][:, cols].sum(axis=0, keepdims=True),
+                             np.fmin.reduce(d["image_min"][:, cols], axis=0, keepdims=True),
+                             np.fmax.reduce(d["image_max"][:, cols], axis=0, keepdims=True), stats, features)
+        return table.stack(level=1, future_stack=True).droplevel(0)
+
+    def quantile(self, q, level="well", features=None):
+        """
+        Approximate q-quantile per well ('well'), per image ('image') or for the plate
+        ('plate') from the stored sketches. Image sketches also answer well and plate
+        queries (a well's sketch is the union of its images'); well sketches cannot
+        answer image queries.
+        """
+        features, cols = self._columns(features)
+        source = "well" if level != "image" and "well_sketch_values" in self.data else "image"
+        if f"{source}_sketch_values" not in self.data:
+            raise ValueError(f"This QC index was built without {level}-level quantile sketches.")
+        values = self.data[f"{source}_sketch_values"][:, cols]
+        weights = self.data[f"{source}_sketch_weights"]
+        if level == "plate":
+            result = ColumnQuantileSketch.weighted_quantile(values, weights, q)
+            return pd.Series(result, index=features, name=q)
+        offsets = self.data[f"{source}_sketch_offsets"]
+        if source == "image" and level == "well":
+            # Images are stored well by well, so each well's sketch rows are contiguous
+            offsets = offsets[np.searchsorted(self.data["image_well"], np.arange(len(self.wells) + 1))]
+        rows = [ColumnQuantileSketch.weighted_quantile(values[a:b], weights[a:b], q)
+                for a, b in zip(offsets[:-1], offsets[1:])]
+        table = pd.DataFrame(np.array(rows).reshape(len(rows), len(features)), columns=features)
+        if level == "image":
+            table.index = pd.MultiIndex.from_arrays([np.array(self.wells)[self.data["image_well"]],
+                                                     self.data["image_numbers"]],
+                                                    names=["Metadata_WellID", "ImageNumber"])
+        else:
+            table.index = pd.Index(self.wells, name="Metadata_WellID")
+        return table
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+class WorkShards:
+    """
+    Work-unit claims shared between nodes through a common directory (e.g. on NFS).
+
+    A unit is claimed by creating <unit>.lock with O_CREAT | O_EXCL, so exactly one node
+    wins. The holder touches the lock while it works; a lock not touched for stale_after
+    seconds belongs to a dead node and may be taken over: it is renamed away first (so
+    only one node takes it) and then checked to still be the stale lock that was seen,
+    since another node may have replaced it with a fresh claim in between. Finished units
+    get a <unit>.done marker, failed ones <unit>.failed.
+    """
+    def __init__(self, shard_dir, stale_after=600.0, node_id=None):
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.stale_after = stale_after
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def unit_key(unit):
+        """File-system safe name for a unit given as a relative path."""
+        return str(unit).replace(os.sep, "__").replace("/", "__")
+
+    def _path(self, unit, suffix):
+        return self.shard_dir / f"{self.unit_key(unit)}.{suffix}"
+
+    def status(self, unit):
+        """'done', 'failed', 'locked' or None (free)."""
+        for status, suffix in (("done", "done"), ("failed", "failed"), ("locked", "lock")):
+            if self._path(unit, suffix).exists():
+                return status
+        return None
+
+    def claim(self, unit, retry_failed=False):
+        """Tries to take unit for this node. Returns True if it is now ours."""
+        if self._path(unit, "done").exists() or (not retry_failed and self._path(unit, "failed").exists()):
+            return False
+        lock = self._path(unit, "lock")
+        for _ in range(2):
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._break_stale(lock):
+                    return False
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump({"node": self.node_id, "claimed": time.time()}, f)
+            # A node may have finished the unit between our check and the claim
+            if self._path(unit, "done").exists():
+                lock.unlink(missing_ok=True)
+                return False
+            return True
+        return False
+
+    @staticmethod
+    def _read_lock(path):
+        st = path.stat()
+        with open(path) as f:
+            return st, f.read()
+
+    def _break_stale(self, lock):
+        """Removes lock if it is stale. Returns True if the unit may be claimed again."""
+        try:
+            seen, content = self._read_lock(lock)
+        except FileNotFoundError:
+            return True
+        if time.time() - seen.st_mtime < self.stale_after:
+            return False
+        taken = lock.with_name(f"{lock.name}.stale.{self.node_id.replace(':', '_')}")
+        try:
+            # rename is atomic: of several nodes finding the same stale lock, one succeeds
+            os.rename(lock, taken)
+        except FileNotFoundError:
+            return True
+        # Between the check and the rename another node may have broken the lock and claimed
+        # the unit afresh, in which case the rename took its lock: check what was moved
+        try:
+            st, moved = self._read_lock(taken)
+        except FileNotFoundError:
+            return False
+        if (st.st_ino, moved) == (seen.st_ino, content) and time.time() - st.st_mtime >= self.stale_after:
+            taken.unlink(missing_ok=True)
+            return True
+        try:
+            # Give the live lock back (a hard link fails instead of replacing a newer lock)
+            os.link(taken, lock)
+        except FileExistsError:
+            pass
+        taken.unlink(missing_ok=True)
+        return False
+
+    def _finish(self, unit, suffix, message):
+        marker = self._path(unit, suffix)
+        tmp = marker.with_name(f"{marker.name}.{self.node_id.replace(':', '_')}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"node": self.node_id, "finished": time.time(), "message": message}, f)
+        os.replace(tmp, marker)
+        if suffix == "done":
+            self._path(unit, "failed").unlink(missing_ok=True)
+        self._path(unit, "lock").unlink(missing_ok=True)
+
+    def complete(self, unit, message=""):
+        self._finish(unit, "done", message)
+
+    def fail(self, unit, message=""):
+        self._finish(unit, "failed", message)
+
+    def release(self, unit):
+        """Gives a claimed unit back unfinished (e.g. on cancellation)."""
+        self._path(unit, "lock").unlink(missing_ok=True)
+
+    @contextmanager
+    def heartbeat(self, unit):
+        """Keeps the unit's lock fresh while the body runs."""
+        lock, stop = self._path(unit, "lock"), threading.Event()
+
+        def beat():
+            while not stop.wait(self.stale_after / 4):
+                try:
+                    os.utime(lock)
+                except FileNotFoundError:
+                    return
+
+        thread = threading.Thread(target=beat, name="ShardHeartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,111 @@
+import numpy as np
+
+class RunningMoments:
+    """
+    Exact per-column count, mean and variance over a stream of 2-D blocks (NaNs ignored),
+    combined chunk by chunk with Chan's parallel update so blocks can also be merged.
+    """
+    def __init__(self, n_cols):
+        self.n = np.zeros(n_cols)
+        self.mean = np.zeros(n_cols)
+        self.m2 = np.zeros(n_cols)
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        n = np.sum(~np.isnan(block), axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, np.nansum(block, axis=0) / n, 0.0)
+        m2 = np.nansum((block - mean) ** 2, axis=0)
+        self._combine(n, mean, m2)
+
+    def merge(self, other):
+        self._combine(other.n, other.mean, other.m2)
+        return self
+
+    def _combine(self, n, mean, m2):
+        total = self.n + n
+        safe = np.where(total > 0, total, 1.0)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / safe
+        self.m2 = self.m2 + m2 + delta ** 2 * self.n * n / safe
+        self.n = total
+
+    @property
+    def var(self):
+        """Population variance (ddof=0); NaN for columns without values."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > 0, self.m2 / self.n, np.nan)
+
+class ColumnQuantileSketch:
+    """
+    Mergeable KLL-style quantile sketch kept for every column of a 2-D stream at once.
+
+    Level h holds rows that each stand for 2**h input rows. When a level grows past k rows
+    it is sorted column-wise and every other row (random offset) is promoted to the next
+    level. With k = 2 / error the rank error of a query stays around error * n; memory is
+    O(k log(n / k)) values per column. NaNs are carried along and ignored by queries.
+    """
+    def __init__(self, n_cols, error=0.001, seed=0):
+        if not 0 < error < 1:
+            raise ValueError(f"Sketch error must be between 0 and 1, got {error}.")
+        self.n_cols = n_cols
+        self.k = max(int(np.ceil(2.0 / error)), 8)
+        self.levels = []
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        self._add(0, block, block_sorted=False)
+
+    def merge(self, other):
+        for h, rows in enumerate(other.levels):
+            self._add(h, rows, block_sorted=False)
+        return self
+
+    def _add(self, h, rows, block_sorted):
+        while len(rows):
+            if h == len(self.levels):
+                self.levels.append(np.empty((0, self.n_cols)))
+            if len(self.levels[h]):
+                rows, block_sorted = np.concatenate([self.levels[h], rows]), False
+            if len(rows) <= self.k:
+                self.levels[h] = rows
+                return
+            # Compact: keep an odd leftover row, promote every other sorted row
+            even = len(rows) - len(rows) % 2
+            self.levels[h] = rows[even:]
+            compact = rows[:even] if block_sorted else np.sort(rows[:even], axis=0)
+            # Promoted rows stay sorted, so the next level can skip its sort when empty
+            rows, block_sorted = compact[self.rng.integers(2)::2], True
+            h += 1
+
+    def weighted(self):
+        """The retained rows and the number of input rows each stands for (for storing or merging sketches)."""
+        values = np.concatenate(self.levels) if self.levels else np.empty((0, self.n_cols))
+        weights = np.concatenate([np.full(len(rows), 2.0 ** h) for h, rows in enumerate(self.levels)]
+                                 or [np.empty(0)])
+        return values, weights
+
+    @staticmethod
+    def weighted_quantile(values, weights, q):
+        """Per-column q-quantile of weighted rows, e.g. the output of weighted(); NaNs are ignored."""
+        cols = np.arange(values.shape[1])
+        order = np.argsort(values, axis=0)  # NaNs sort last
+        v = np.take_along_axis(values, order, axis=0)
+        w = np.where(np.isnan(v), 0.0, weights[order])
+        cw = np.cumsum(w, axis=0)
+        total = cw[-1] if len(cw) else np.zeros(values.shape[1])
+        idx = np.minimum(np.sum(cw < q * total, axis=0), max(len(v) - 1, 0))
+        result = v[idx, cols] if len(v) else np.full(values.shape[1], np.nan)
+        return np.where(total > 0, result, np.nan)
+
+    def quantile(self, q):
+        """Approximate per-column q-quantile."""
+        values, weights = self.weighted()
+        return self.weighted_quantile(values, weights, q)
+
+    def median_mad(self):
+        """Approximate per-column median and (unscaled) median absolute deviation."""
+        values, weights = self.weighted()
+        median = self.weighted_quantile(values, weights, 0.5)
+        return median, self.weighted_quantile(np.abs(values - median), weights, 0.5)
@@ -0,0 +1,116 @@
+import mmap
+import queue
+import threading
+import numpy as np
+import tifffile
+
+def map_plane(path):
+    """
+    Memory-maps an uncompressed, contiguous TIFF and asks the OS to start reading it
+    in the background. Returns None when the file cannot be mapped (e.g. compressed).
+    """
+    try:
+        arr = tifffile.memmap(path, mode='r')
+    except (ValueError, OSError, tifffile.TiffFileError):
+        return None
+    raw = getattr(arr, '_mmap', None)
+    if raw is not None and hasattr(mmap, 'MADV_WILLNEED'):
+        raw.madvise(mmap.MADV_WILLNEED)
+    return arr
+
+class PlaneRegionReader:
+    """
+    Reads rectangular regions of a TIFF plane (first sample of the first page) without
+    decoding the whole plane. Uncompressed contiguous planes are memory-mapped; compressed
+    ones are read strip by strip or tile by tile, decoding only the chunks that overlap
+    the region. Decoded chunks are kept until a read no longer needs them, so walking the
+    plane tile row by tile row decodes every chunk once; memory stays at the chunks of
+    one region (for striped files, full-width strips covering its rows).
+    """
+    def __init__(self, path):
+        self.plane = map_plane(path)
+        self.tif = None
+        self.chunks = {}
+        self.peak_bytes = 0
+        if self.plane is not None:
+            self.shape, self.dtype = self.plane.shape[:2], self.plane.dtype
+            return
+        self.tif = tifffile.TiffFile(path)
+        self.page = self.tif.pages[0]
+        self.shape, self.dtype = self.page.shape[:2], self.page.dtype
+        self.chunk_shape = self.page.chunks[:2]
+        self.grid_width = -(-self.page.imagewidth // self.chunk_shape[1])
+
+    def _decode(self, index):
+        fh = self.tif.filehandle
+        fh.seek(self.page.dataoffsets[index])
+        segment, _, _ = self.page.decode(fh.read(self.page.databytecounts[index]), index,
+                                         jpegtables=self.page.jpegtables)
+        return segment[0, :, :, 0]
+
+    def read(self, y0, y1, x0, x1):
+        if self.plane is not None:
+            region = self.plane[y0:y1, x0:x1]
+            return region[..., 0] if region.ndim > 2 else region
+        ch, cw = self.chunk_shape
+        needed = {(cy, cx) for cy in range(y0 // ch, (y1 - 1) // ch + 1)
+                  for cx in range(x0 // cw, (x1 - 1) // cw + 1)}
+        self.chunks = {key: chunk for key, chunk in self.chunks.items() if key in needed}
+        out = np.empty((y1 - y0, x1 - x0), dtype=self.dtype)
+        for cy, cx in sorted(needed):
+            if (cy, cx) not in self.chunks:
+                self.chunks[cy, cx] = self._decode(cy * self.grid_width + cx)
+            chunk = self.chunks[cy, cx]
+            # Intersection of the chunk (which may be padded past the plane edge) and the region
+            top, left = max(y0, cy * ch), max(x0, cx * cw)
+            bottom, right = min(y1, cy * ch + chunk.shape[0]), min(x1, cx * cw + chunk.shape[1])
+            out[top - y0:bottom - y0, left - x0:right - x0] = chunk[top - cy * ch:bottom - cy * ch,
+                                                                    left - cx * cw:right - cx * cw]
+        self.peak_bytes = max(self.peak_bytes, sum(chunk.nbytes for chunk in self.chunks.values()))
+        return out
+
+    def close(self):
+        self.chunks = {}
+        self.plane = None
+        if self.tif is not None:
+            self.tif.close()
+
+class BackgroundWriter:
+    """
+    Dedicated writer thread fed by a bounded queue. put() blocks while the queue is
+    full, which throttles producers to the write bandwidth. The first write error is
+    re-raised from put() or when the context exits.
+    """
+    def __init__(self, write_fn, depth=8):
+        self.write_fn = write_fn
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.error = None
+        self.written = 0
+        self.thread = threading.Thread(target=self._drain, name="BackgroundWriter", daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.write_fn(*item)
+                    self.written += 1
+                except Exception as e:
+                    self.error = e
+
+    def put(self, *args):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.queue.put(None)
+        self.thread.join()
+        if exc_type is None and self.error is not None:
+            raise self.error
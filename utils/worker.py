@@ -2,6 +2,9 @@ import sys
 import traceback
 from PyQt6.QtCore import QRunnable, pyqtSlot, pyqtSignal, QObject
 
+from utils.metrics import StageMetrics
+from utils.progress import AnalysisCancelled, CancellationToken, ThrottledProgress
+
 class WorkerSignals(QObject):
     """
     Defines the signals available from a running worker thread.
@@ -10,30 +13,52 @@ class WorkerSignals(QObject):
     error = pyqtSignal(tuple)
     result = pyqtSignal(object)
     progress = pyqtSignal(int)
+    cancelled = pyqtSignal()
 
 class AnalysisWorker(QRunnable):
     """
     Worker thread for running analysis plugins without freezing the UI.
     """
+    # Progress signals are coalesced to at most one per interval (seconds)
+    PROGRESS_INTERVAL = 0.1
+
     def __init__(self, fn, *args, **kwargs):
         super().__init__()
         self.fn = fn
         self.args = args
         self.kwargs = kwargs
         self.signals = WorkerSignals()
+        self.cancel_token = CancellationToken()
+        self.progress = ThrottledProgress(self.signals.progress, self.PROGRESS_INTERVAL)
 
         # Automatically inject the progress_callback signal if the plugin accepts it [cite: 17, 40]
         if 'progress_callback' in self.kwargs:
-            self.kwargs['progress_callback'] = self.signals.progress
+            self.kwargs['progress_callback'] = self.progress
+        if 'cancel_token' in self.kwargs:
+            self.kwargs['cancel_token'] = self.cancel_token
+        # Per-stage metrics, written as JSONL when the run ends
+        self.metrics = None
+        self.metrics_path = None
+        if 'metrics' in self.kwargs:
+            self.metrics = self.kwargs['metrics'] = StageMetrics()
+
+    def cancel(self):
+        """Asks the plugin to stop at its next cancellation check."""
+        self.cancel_token.cancel()
 
     @pyqtSlot()
     def run(self):
         """
         Initializes the runner function with passed args and kwargs.
         """
+        status = "error"
         try:
             # Execute the plugin's run function [cite: 39]
             result = self.fn(*self.args, **self.kwargs)
+            status = "finished"
+        except AnalysisCancelled:
+            status = "cancelled"
+            self.signals.cancelled.emit()
         except Exception:
             # Error Resilience: Catch and report errors without crashing the App 
             traceback.print_exc()
@@ -42,4 +67,17 @@ class AnalysisWorker(QRunnable):
         else:
             self.signals.result.emit(result)
         finally:
-            self.signals.finished.emit()
\ No newline at end of file
+            self.progress.flush()
+            self.save_metrics(status)
+            self.signals.finished.emit()
+
+    def save_metrics(self, status):
+        if self.metrics is None:
+            return
+        owner = getattr(self.fn, '__self__', None)
+        run_name = getattr(owner, 'NAME', None) or getattr(self.fn, '__module__', 'analysis')
+        try:
+            self.metrics_path = self.metrics.write_jsonl(run_name, status=status,
+                                                         data_path=str(self.kwargs.get('data_path', '')))
+        except OSError:
+            traceback.print_exc()
\ No newline at end of file